@@ -0,0 +1,256 @@
+"""本地归因HTTP服务：启动时加载一次数据，之后从内存中回答任意窗口的归因查询
+
+只依赖标准库asyncio及项目已使用的pandas/numpy。数据来自店铺 × 日期的每日数组（daily_cube.py），
+每个窗口的周期立方体和每个查询的结果都在内存中按LRU缓存；多个请求同时查询同一窗口时，
+只计算一次，其余请求等待同一个计算结果。计算在线程池中进行，不阻塞事件循环。
+
+接口（GET，返回JSON）：
+    /summary         各周期汇总及与对比期的变化
+    /decomposition   客流量与客单价贡献度
+    /dimensions      维度贡献度，dims为立方体中除Store外的维度，如StoreType|Promo|SchoolHoliday（可用逗号组合）
+    /calendar        日历调整归因（天数、开门率、促销天数占比、每个开门日的销售额）
+    /health          服务状态和数据日期范围
+    /stats           缓存命中、合并的并发请求等统计
+查询参数：freq=W|M|Q（默认M）、compare=mom|yoy（默认mom）、periods=N（默认4，同比时窗口向前多取一年）、
+start、end（YYYY-MM-DD）。参数不合法、窗口内没有数据或没有可对比的周期时返回400。
+
+用法（在项目目录下运行）：
+    python attribution_service.py [--host 127.0.0.1] [--port 8765]
+    curl 'http://127.0.0.1:8765/dimensions?dims=StoreType&freq=M&periods=6'
+"""
+import asyncio
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import daily_cube
+from sales_analysis import (COMPARE_LABELS, CUBE_DIMS, FREQ_CHOICES, N_PERIODS, calendar_attribution,
+                            check_comparable, comparison_lag, customer_ticket_contribution, dimension_contribution,
+                            read_store_data, resolve_window, summarize_periods, window_periods, with_period_labels)
+from sales_cache import LRUCache
+
+# 内存中保留的窗口立方体数和查询结果数
+CUBE_CACHE_SIZE = 16
+RESULT_CACHE_SIZE = 256
+
+# 计算线程数
+COMPUTE_WORKERS = 2
+
+# 维度贡献度可用的维度（店铺维度在店铺级接口之外不单独开放）
+SERVICE_DIMS = [dim for dim in CUBE_DIMS if dim != 'Store']
+
+# 请求头的最大字节数
+MAX_HEADER_BYTES = 16384
+
+
+class BadRequest(ValueError):
+    """请求参数不合法"""
+
+
+class AttributionService:
+    """持有预热的数据，回答归因查询
+
+    相同的窗口立方体或查询结果正在计算时，后来的请求直接等待同一个计算任务（合并并发请求）。
+    """
+
+    def __init__(self, train_path='train.csv', store_path='store.csv', workers=COMPUTE_WORKERS):
+        self.train_path = train_path
+        self.daily = daily_cube.open_daily_cube(train_path)
+        self.store_data = read_store_data(store_path)
+        self.cubes = LRUCache(CUBE_CACHE_SIZE)
+        self.results = LRUCache(RESULT_CACHE_SIZE)
+        self.stats = {'requests': 0, 'cache_hits': 0, 'computed': 0, 'deduplicated': 0}
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def _once(self, cache, key, func, *args):
+        """从cache取key；未命中时在线程池中计算一次，同一key的并发请求共享这次计算"""
+        value = cache.get(key)
+        if value is not None:
+            self.stats['cache_hits'] += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(cache, key, func, *args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats['deduplicated'] += 1
+        # shield：某个客户端断开时不取消其他请求也在等待的计算
+        return await asyncio.shield(task)
+
+    async def _compute(self, cache, key, func, *args):
+        value = await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        self.stats['computed'] += 1
+        cache.put(key, value)
+        return value
+
+    def _window(self, params):
+        """解析查询参数中的窗口，返回(freq, compare, start, end)"""
+        freq = params.get('freq', 'M')
+        compare = params.get('compare', 'mom')
+        if freq not in FREQ_CHOICES:
+            raise BadRequest(f"freq应为{'/'.join(FREQ_CHOICES)}之一")
+        if compare not in COMPARE_LABELS:
+            raise BadRequest(f"compare应为{'/'.join(COMPARE_LABELS)}之一")
+        try:
+            periods = int(params.get('periods', N_PERIODS))
+            if periods < 1:
+                raise ValueError
+            start, end = resolve_window(self.train_path, freq, window_periods(periods, freq, compare),
+                                        params.get('start'), params.get('end'),
+                                        max_date=self.daily.last_date)
+        except ValueError:
+            raise BadRequest("periods应为正整数，start/end应为YYYY-MM-DD格式的日期")
+        return freq, compare, start, end
+
+    def _window_cube(self, freq, start, end):
+        cube = daily_cube.window_cube(self.daily, self.store_data, freq, start, end)
+        if len(cube) == 0:
+            raise BadRequest(f"窗口 {start} ~ {end or '最新'} 内没有数据")
+        return cube
+
+    async def cube(self, freq, compare, start, end):
+        cube = await self._once(self.cubes, ('cube', freq, start, end), self._window_cube, freq, start, end)
+        try:
+            check_comparable(cube, freq, compare)
+        except ValueError as e:
+            raise BadRequest(str(e))
+        return cube
+
+    async def summary(self, params):
+        freq, compare, start, end = self._window(params)
+        cube = await self.cube(freq, compare, start, end)
+        lag = comparison_lag(freq, compare)
+        return await self._once(self.results, ('summary', freq, compare, start, end),
+                                summarize_periods, cube, lag)
+
+    async def decomposition(self, params):
+        freq, compare, start, end = self._window(params)
+        period_sales = await self.summary(params)
+        lag = comparison_lag(freq, compare)
+        return await self._once(self.results, ('decomposition', freq, compare, start, end),
+                                customer_ticket_contribution, period_sales, lag)
+
+    async def dimensions(self, params):
+        dims = [dim for dim in params.get('dims', 'StoreType').split(',') if dim]
+        unknown = [dim for dim in dims if dim not in SERVICE_DIMS]
+        if not dims or unknown:
+            raise BadRequest(f"dims应为{'/'.join(SERVICE_DIMS)}中的一个或多个（逗号分隔）")
+        freq, compare, start, end = self._window(params)
+        cube = await self.cube(freq, compare, start, end)
+        period_sales = await self.summary(params)
+        total_sales_change = period_sales.set_index('YearMonth')['Sales_MoM_Change']
+        lag = comparison_lag(freq, compare)
+        return await self._once(self.results, ('dimensions', tuple(dims), freq, compare, start, end),
+                                dimension_contribution, cube, dims, total_sales_change, lag)
+
+    async def calendar(self, params):
+        freq, compare, start, end = self._window(params)
+        cube = await self.cube(freq, compare, start, end)
+        lag = comparison_lag(freq, compare)
+        return await self._once(self.results, ('calendar', freq, compare, start, end),
+                                calendar_attribution, cube, lag)
+
+    async def handle(self, path, params):
+        """按路径分派查询，返回(状态码, 可JSON序列化的响应体或JSON字符串)"""
+        self.stats['requests'] += 1
+        if path == '/health':
+            return HTTPStatus.OK, {'status': 'ok', 'first_date': self.daily.first_date.strftime('%Y-%m-%d'),
+                                   'last_date': self.daily.last_date, 'stores': int(len(self.daily.stores))}
+        if path == '/stats':
+            return HTTPStatus.OK, dict(self.stats, cached_cubes=len(self.cubes), cached_results=len(self.results),
+                                       inflight=len(self._inflight))
+
+        handlers = {'/summary': self.summary, '/decomposition': self.decomposition, '/dimensions': self.dimensions,
+                    '/calendar': self.calendar}
+        if path not in handlers:
+            return HTTPStatus.NOT_FOUND, {'error': f"未知接口: {path}", 'endpoints': sorted(handlers)}
+        try:
+            table = await handlers[path](params)
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        freq = params.get('freq', 'M')
+        rows = with_period_labels(table, freq).to_json(orient='records', force_ascii=False, double_precision=15)
+        return HTTPStatus.OK, f'{{"freq": {json.dumps(freq)}, "rows": {rows}}}'
+
+
+async def _respond(writer, status, body, keep_alive):
+    payload = (body if isinstance(body, str) else json.dumps(body, ensure_ascii=False)).encode('utf-8')
+    head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(payload)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    writer.write(head.encode('ascii') + payload)
+    await writer.drain()
+
+
+async def handle_connection(service, reader, writer):
+    """处理一个HTTP/1.1连接（支持keep-alive，只接受GET）"""
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                break
+            lines = head.decode('latin-1').split('\r\n')
+            parts = lines[0].split()
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = headers.get('connection', '').lower() != 'close' and parts[-1:] == ['HTTP/1.1']
+
+            if len(parts) != 3 or parts[0] != 'GET':
+                await _respond(writer, HTTPStatus.METHOD_NOT_ALLOWED, {'error': '只支持GET请求'}, False)
+                break
+            url = urlsplit(parts[1])
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            start = time.perf_counter()
+            try:
+                status, body = await service.handle(url.path, params)
+            except Exception:
+                # 内部错误的详情只写入服务日志，不返回给客户端
+                traceback.print_exc()
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': '服务内部错误'}
+            await _respond(writer, status, body, keep_alive)
+            print(f"{parts[0]} {parts[1]} {status.value} {(time.perf_counter() - start) * 1000:.1f} ms")
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8765, train_path='train.csv', store_path='store.csv'):
+    """加载数据并启动服务，直到被中断"""
+    print("正在加载数据...")
+    service = AttributionService(train_path, store_path)
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port,
+                                        limit=MAX_HEADER_BYTES)
+    print(f"归因服务已启动: http://{host}:{port}（数据 {service.daily.first_date:%Y-%m-%d} ~ "
+          f"{service.daily.last_date}，{len(service.daily.stores)} 家店）")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地归因HTTP服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址，默认127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口，默认8765')
+    parser.add_argument('--train', default='train.csv', help='销售数据文件，默认train.csv')
+    parser.add_argument('--store', default='store.csv', help='店铺信息文件，默认store.csv')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.train, args.store))
+    except KeyboardInterrupt:
+        print("服务已停止")
+
+
+if __name__ == "__main__":
+    main()
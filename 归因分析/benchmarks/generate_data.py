@@ -0,0 +1,195 @@
+"""合成与Rossmann train.csv结构一致的销售数据，用于基准测试
+
+店铺属性取自项目中的store.csv（1115家店），店铺数更多时从中有放回地抽样并重新编号，
+生成的store.csv和train.csv写入同一目录。相同的--seed和参数总是生成相同的数据。
+train.csv按日期降序、店铺升序分块写出（与原始数据的排列一致），内存占用与店铺数成正比，
+与天数无关，可以生成10万家店的数据。
+
+用法（在项目目录下运行）：
+    python benchmarks/generate_data.py [--stores 1115] [--years 2.5] [--seed 0] [--output-dir benchmarks/data]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# 项目目录（benchmarks的上一级）
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认数据范围的最后一天（与原始train.csv一致）
+END_DATE = '2015-07-31'
+
+# 每块写出的目标行数
+BLOCK_ROWS = 1000000
+
+# 店铺所在的州数，州决定法定节假日和学校假期
+N_STATES = 12
+
+# 周一到周日的客流系数
+DOW_FACTORS = np.array([1.15, 1.0, 0.95, 0.95, 1.0, 0.9, 0.4])
+
+# 店铺类型的客流系数和商品组合(Assortment)的客单价
+STORE_TYPE_TRAFFIC = {'a': 1.0, 'b': 2.5, 'c': 1.0, 'd': 0.9}
+ASSORTMENT_TICKET = {'a': 9.0, 'b': 8.0, 'c': 10.0}
+
+
+def easter(year):
+    """计算复活节日期（格里高利历）"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return pd.Timestamp(year, month, day)
+
+
+def state_holidays(years):
+    """返回{日期: (类型, 适用的州)}，类型a=法定节假日, b=复活节, c=圣诞节"""
+    all_states = np.ones(N_STATES, dtype=bool)
+    southern = np.arange(N_STATES) < N_STATES // 3
+    holidays = {}
+    for year in years:
+        egg = easter(year)
+        holidays[pd.Timestamp(year, 1, 1)] = ('a', all_states)
+        holidays[pd.Timestamp(year, 1, 6)] = ('a', southern)
+        holidays[egg - pd.Timedelta(days=2)] = ('b', all_states)
+        holidays[egg + pd.Timedelta(days=1)] = ('b', all_states)
+        holidays[pd.Timestamp(year, 5, 1)] = ('a', all_states)
+        holidays[egg + pd.Timedelta(days=39)] = ('a', all_states)
+        holidays[egg + pd.Timedelta(days=50)] = ('a', all_states)
+        holidays[egg + pd.Timedelta(days=60)] = ('a', southern)
+        holidays[pd.Timestamp(year, 10, 3)] = ('a', all_states)
+        holidays[pd.Timestamp(year, 11, 1)] = ('a', southern)
+        holidays[pd.Timestamp(year, 12, 25)] = ('c', all_states)
+        holidays[pd.Timestamp(year, 12, 26)] = ('c', all_states)
+    return holidays
+
+
+def school_holiday_mask(dates, states):
+    """返回(天数, 州数)的学校假期标记：暑假按州错开6周，另有圣诞和复活节假期"""
+    dates = pd.DatetimeIndex(dates)
+    day_of_year = dates.dayofyear.to_numpy()[:, None]
+    summer_start = 180 + 4 * np.arange(N_STATES)[None, :]
+    summer = (day_of_year >= summer_start) & (day_of_year < summer_start + 42)
+    christmas = (day_of_year >= 357) | (day_of_year <= 5)
+    easter_days = np.array([(d - easter(d.year)).days for d in dates])
+    easter_break = (np.abs(easter_days) <= 7)[:, None]
+    return (summer | christmas | easter_break)[:, states]
+
+
+def generate_stores(n_stores, rng, store_path=os.path.join(PROJECT_DIR, 'store.csv')):
+    """生成店铺属性表：不超过1115家时直接取store.csv的前n_stores家，否则抽样扩充"""
+    stores = pd.read_csv(store_path)
+    if n_stores <= len(stores):
+        return stores.iloc[:n_stores].reset_index(drop=True)
+    extra = stores.iloc[rng.integers(0, len(stores), n_stores - len(stores))]
+    stores = pd.concat([stores, extra], ignore_index=True)
+    stores['Store'] = np.arange(1, n_stores + 1)
+    return stores
+
+
+def store_profiles(stores, rng):
+    """为每家店抽取所在州、基础客流、基础客单价以及是否周日营业"""
+    n = len(stores)
+    traffic = stores['StoreType'].map(STORE_TYPE_TRAFFIC).fillna(1.0).to_numpy()
+    ticket = stores['Assortment'].map(ASSORTMENT_TICKET).fillna(9.0).to_numpy()
+    return {
+        'state': rng.integers(0, N_STATES, n),
+        'customers': rng.lognormal(np.log(600), 0.35, n) * traffic,
+        'ticket': ticket * rng.lognormal(0, 0.1, n),
+        'sunday_open': rng.random(n) < 0.03,
+    }
+
+
+def generate_block(dates, stores, profiles, holidays, rng):
+    """生成一批日期（降序）× 全部店铺的train数据"""
+    n_days, n_stores = len(dates), len(stores)
+    dates = pd.DatetimeIndex(dates)
+    dow = dates.dayofweek.to_numpy()
+
+    # 促销：隔周的周一到周五
+    promo = np.broadcast_to(((dates.isocalendar().week.to_numpy() % 2 == 0) & (dow < 5))[:, None],
+                            (n_days, n_stores))
+
+    # 法定节假日按州适用
+    state_holiday = np.full((n_days, n_stores), '0', dtype=object)
+    for i, date in enumerate(dates):
+        if date in holidays:
+            kind, states = holidays[date]
+            state_holiday[i, states[profiles['state']]] = kind
+    school_holiday = school_holiday_mask(dates, profiles['state'])
+
+    # 营业：周日和法定节假日通常关门，另有少量随机停业
+    is_open = ((dow[:, None] != 6) | profiles['sunday_open'][None, :]) & (state_holiday == '0')
+    is_open &= rng.random((n_days, n_stores)) > 0.01
+
+    # 客流与客单价：星期、促销、学校假期和12月旺季
+    season = np.where(dates.month == 12, 1.25, 1.0) * (1 + 0.03 * (dates.year.to_numpy() - 2013))
+    customers = (profiles['customers'][None, :] * DOW_FACTORS[dow][:, None] * season[:, None]
+                 * np.where(promo, 1.2, 1.0) * np.where(school_holiday, 1.03, 1.0)
+                 * rng.lognormal(0, 0.12, (n_days, n_stores)))
+    customers = np.where(is_open, np.rint(customers), 0).astype(np.int32)
+    ticket = (profiles['ticket'][None, :] * np.where(promo, 1.08, 1.0)
+              * rng.lognormal(0, 0.08, (n_days, n_stores)))
+    sales = np.rint(customers * ticket).astype(np.int32)
+
+    return pd.DataFrame({
+        'Store': np.tile(stores['Store'].to_numpy(), n_days),
+        'DayOfWeek': np.repeat(dow + 1, n_stores),
+        'Date': np.repeat(dates.strftime('%Y-%m-%d'), n_stores),
+        'Sales': sales.ravel(),
+        'Customers': customers.ravel(),
+        'Open': is_open.ravel().astype(np.int8),
+        'Promo': promo.ravel().astype(np.int8),
+        'StateHoliday': state_holiday.ravel(),
+        'SchoolHoliday': school_holiday.ravel().astype(np.int8),
+    })
+
+
+def generate(output_dir, n_stores=1115, years=2.5, end=END_DATE, seed=0):
+    """生成store.csv和train.csv到output_dir，返回train.csv的行数"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    stores = generate_stores(n_stores, rng)
+    stores.to_csv(os.path.join(output_dir, 'store.csv'), index=False)
+    profiles = store_profiles(stores, rng)
+
+    end = pd.Timestamp(end)
+    start = end - pd.Timedelta(days=int(round(years * 365.25)) - 1)
+    dates = pd.date_range(start, end)[::-1]
+    holidays = state_holidays(range(start.year, end.year + 1))
+
+    # 按日期降序分块写出，每块约BLOCK_ROWS行
+    block_days = max(1, BLOCK_ROWS // n_stores)
+    train_path = os.path.join(output_dir, 'train.csv')
+    rows = 0
+    for i in range(0, len(dates), block_days):
+        block = generate_block(dates[i:i + block_days], stores, profiles, holidays, rng)
+        block.to_csv(train_path, index=False, mode='w' if i == 0 else 'a', header=i == 0)
+        rows += len(block)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成Rossmann结构的合成销售数据')
+    parser.add_argument('--stores', type=int, default=1115, help='店铺数，默认1115（超过时从store.csv抽样扩充）')
+    parser.add_argument('--years', type=float, default=2.5, help='数据覆盖的年数，默认2.5')
+    parser.add_argument('--end', default=END_DATE, help=f'最后一天(YYYY-MM-DD)，默认{END_DATE}')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，默认0')
+    parser.add_argument('--output-dir', default=os.path.join(PROJECT_DIR, 'benchmarks', 'data'),
+                        help='输出目录，默认benchmarks/data')
+    args = parser.parse_args()
+
+    rows = generate(args.output_dir, args.stores, args.years, args.end, args.seed)
+    print(f"已生成 {args.stores} 家店、{rows} 行数据到 {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""流水线分阶段基准：在合成数据上对读取、预处理、聚合、归因和输出逐阶段计时
+
+数据目录中没有train.csv时先用generate_data.py按--stores/--years/--seed生成。
+每个阶段记录耗时、输出行数和进程的峰值RSS（到该阶段结束为止的最大值），
+结果保存为JSON，可以用--compare与之前版本保存的结果对比。
+各阶段直接调用sales_analysis、run_analysis和visualize_results的函数，不使用预处理缓存。
+
+用法（在项目目录下运行）：
+    python benchmarks/pipeline.py [--stores 1115] [--years 2.5] [--periods 4] [--freq M]
+                                  [--label NAME] [--compare benchmarks/results/OLD.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+
+# 项目目录（benchmarks的上一级）
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(PROJECT_DIR, 'benchmarks')
+sys.path.insert(0, PROJECT_DIR)
+
+import profiling  # noqa: E402
+
+# 对比结果时超过该比例的变慢（或内存增加）标记为回退
+REGRESSION_THRESHOLD = 1.1
+
+# 耗时变化小于该秒数时视为测量噪声，不标记回退
+MIN_REGRESSION_SECONDS = 0.05
+
+# 流水线各阶段都嵌套在该阶段之下，用于从追踪记录中取出基准阶段
+PIPELINE_STAGE = 'pipeline'
+
+
+def git_revision():
+    """当前代码的git提交号，不在git仓库中时返回None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ensure_data(data_dir, stores, years, seed):
+    """数据目录中的数据与参数不符时重新生成，返回train.csv的行数"""
+    params = {'stores': stores, 'years': years, 'seed': seed}
+    params_path = os.path.join(data_dir, 'params.json')
+    try:
+        with open(params_path, 'r', encoding='utf-8') as f:
+            known = json.load(f)
+        if known['params'] == params and os.path.exists(os.path.join(data_dir, 'train.csv')):
+            return known['rows']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # 在子进程中生成，避免生成数据的内存计入本进程的峰值RSS
+    print(f"正在生成 {stores} 家店、{years} 年的合成数据...")
+    subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'generate_data.py'), '--stores', str(stores),
+                    '--years', str(years), '--seed', str(seed), '--output-dir', data_dir], check=True)
+    with open(os.path.join(data_dir, 'train.csv'), 'rb') as f:
+        rows = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+    with open(params_path, 'w', encoding='utf-8') as f:
+        json.dump({'params': params, 'rows': rows}, f, indent=2)
+    return rows
+
+
+def pipeline_stages():
+    """从profiling的追踪记录中取出各基准阶段的耗时、输出行数和峰值RSS"""
+    return [{'name': record['name'], 'rows': record['rows_out'], 'seconds': record['wall_s'],
+             'peak_rss_mb': record['peak_rss_mb']}
+            for record in profiling.records() if record['parent'] == PIPELINE_STAGE]
+
+
+def print_stages(stages):
+    """打印各阶段的耗时、峰值RSS（没有时为-）和输出行数"""
+    for stage in stages:
+        rows = '' if stage['rows'] is None else f"  {stage['rows']} 行"
+        rss = '-' if stage['peak_rss_mb'] is None else f"{stage['peak_rss_mb']:8.1f}"
+        print(f"  {stage['name']:<12} {stage['seconds']:8.3f} 秒  峰值RSS {rss:>8} MB{rows}", file=sys.stderr)
+
+
+def run_pipeline(freq, compare, n_periods, workers):
+    """在当前目录的数据上逐阶段运行分析流水线，返回各阶段记录"""
+    import sales_analysis as sa
+    import run_analysis
+
+    profiling.reset()
+    with profiling.stage(PIPELINE_STAGE):
+        with profiling.stage('window') as record:
+            start, end = sa.resolve_window('train.csv', freq, n_periods)
+        if workers > 1:
+            # 并行时各进程自己读取、预处理和汇总分到的月份分区，读取和预处理计入aggregate
+            import out_of_core as ooc
+
+            with profiling.stage('partition') as record:
+                record['rows_out'] = ooc.open_partitions(['train.csv'])['rows']
+            with profiling.stage('aggregate') as record:
+                cube, _ = ooc.load_period_cube(freq, n_periods, start, end, workers=workers)
+                record['rows_out'] = len(cube)
+        else:
+            with profiling.stage('load') as record:
+                train_data = sa.read_train_data('train.csv', start, end)
+                store_data = sa.read_store_data('store.csv')
+                record['rows_out'] = len(train_data)
+            with profiling.stage('preprocess') as record:
+                data = sa.preprocess(train_data, store_data, freq)
+                record['rows_out'] = len(data)
+            del train_data
+            with profiling.stage('aggregate') as record:
+                cube = sa.build_cube(data)
+                record['rows_out'] = len(cube)
+            del data
+        with profiling.stage('attribute') as record:
+            results = sa.attribute(cube, freq, compare)
+            record['rows_out'] = sum(len(df) for df in results.values())
+        with profiling.stage('report') as record:
+            written = sa.report(results, freq, compare, 'output', verbose=False)
+            record['rows_out'] = sum(len(df) for df in written.values())
+        with profiling.stage('conclusion') as record:
+            if not run_analysis.update_conclusion_document(written):
+                raise RuntimeError("结论文档生成失败")
+        with profiling.stage('figures') as record:
+            import visualize_results
+            status = visualize_results.render_figures(written, force=True)
+            record['rows_out'] = sum(state == '完成' for state in status.values())
+    return pipeline_stages()
+
+
+def compare_results(current, baseline):
+    """打印与之前保存的结果的逐阶段对比，返回出现回退的阶段"""
+    previous = {stage['name']: stage for stage in baseline['stages']}
+    print(f"\n与 {baseline.get('label')} ({baseline.get('revision')}) 对比:")
+    print(f"  {'阶段':<12} {'之前(秒)':>10} {'现在(秒)':>10} {'比例':>7} {'之前RSS':>9} {'现在RSS':>9}")
+    regressions = []
+    for stage in current['stages']:
+        old = previous.get(stage['name'])
+        if old is None:
+            print(f"  {stage['name']:<12} {'-':>10} {stage['seconds']:10.3f}")
+            continue
+        ratio = stage['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        mark = ''
+        slower = ratio > REGRESSION_THRESHOLD and stage['seconds'] - old['seconds'] > MIN_REGRESSION_SECONDS
+        # 没有RSS记录（如Windows上）时只比较耗时
+        rss = [old['peak_rss_mb'], stage['peak_rss_mb']]
+        larger = None not in rss and rss[1] > rss[0] * REGRESSION_THRESHOLD
+        if slower or larger:
+            regressions.append(stage['name'])
+            mark = '  回退'
+        old_rss, new_rss = ('-' if value is None else f'{value:.1f}' for value in rss)
+        print(f"  {stage['name']:<12} {old['seconds']:10.3f} {stage['seconds']:10.3f} {ratio:7.2f} "
+              f"{old_rss:>9} {new_rss:>9}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析流水线分阶段基准')
+    parser.add_argument('--stores', type=int, default=1115, help='合成数据的店铺数，默认1115')
+    parser.add_argument('--years', type=float, default=2.5, help='合成数据覆盖的年数，默认2.5')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据的随机种子，默认0')
+    parser.add_argument('--periods', type=int, default=4, help='分析的周期数，默认4')
+    parser.add_argument('--freq', choices=['W', 'M', 'Q'], default='M', help='周期粒度，默认M')
+    parser.add_argument('--compare-mode', dest='compare_mode', choices=['mom', 'yoy'], default='mom',
+                        help='对比方式，默认mom')
+    parser.add_argument('--workers', type=int, default=1, help='聚合使用的进程数，默认1；大于1时从按月分区的文件并行读取和汇总')
+    parser.add_argument('--data-dir', help='数据和输出目录，默认benchmarks/data/<店铺数>x<年数>y-s<种子>')
+    parser.add_argument('--label', help='结果名称，默认为当前git提交号')
+    parser.add_argument('--results-dir', default=os.path.join(BENCH_DIR, 'results'),
+                        help='结果JSON的保存目录，默认benchmarks/results')
+    parser.add_argument('--compare', metavar='RESULT_JSON', help='与之前保存的结果对比，有阶段回退时以非0状态退出')
+    args = parser.parse_args()
+
+    # 切换到数据目录之前先把相对路径转为绝对路径
+    results_dir = os.path.abspath(args.results_dir)
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    data_dir = args.data_dir or os.path.join(BENCH_DIR, 'data', f'{args.stores}x{args.years:g}y-s{args.seed}')
+    rows = ensure_data(data_dir, args.stores, args.years, args.seed)
+
+    # 在数据目录中运行，输出和结论文档都写到该目录下
+    shutil.copy(os.path.join(PROJECT_DIR, 'analysis_conclusion.md'), data_dir)
+    os.chdir(data_dir)
+    print(f"数据: {rows} 行, {args.stores} 家店, 分析 {args.periods} 个周期 ({args.freq}, {args.compare_mode})")
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        stages = run_pipeline(args.freq, args.compare_mode, args.periods, args.workers)
+    print_stages(stages)
+
+    revision = git_revision()
+    import numpy
+    import pandas
+    result = {
+        'label': args.label or revision or 'unknown',
+        'revision': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'params': {'stores': args.stores, 'years': args.years, 'seed': args.seed, 'rows': rows,
+                   'periods': args.periods, 'freq': args.freq, 'compare': args.compare_mode,
+                   'workers': args.workers},
+        'total_seconds': sum(stage['seconds'] for stage in stages),
+        'peak_rss_mb': max((stage['peak_rss_mb'] for stage in stages if stage['peak_rss_mb'] is not None),
+                           default=None),
+        'stages': stages,
+    }
+    peak = '-' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']:.1f}"
+    print(f"合计 {result['total_seconds']:.3f} 秒, 峰值RSS {peak} MB")
+
+    os.makedirs(results_dir, exist_ok=True)
+    result_path = os.path.join(results_dir, f"{result['label']}.json")
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {result_path}")
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline['params'] != result['params']:
+            print("注意: 两次结果的数据规模或参数不同，对比仅供参考")
+        if compare_results(result, baseline):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""启动耗时基准：检查计算路径的导入开销
+
+在全新的解释器中反复导入计算路径上的模块，取中位数耗时（扣除空解释器的启动时间），
+并检查导入后没有加载绘图等重量级依赖。超出预算或加载了禁止的模块时以非0状态退出。
+
+用法（在项目目录下运行）：
+    python benchmarks/startup.py [--repeat 5] [--budget 1.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 项目目录（benchmarks的上一级）
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 计算路径：导入这些模块不应加载绘图依赖
+COMPUTE_MODULES = ['sales_analysis', 'sales_cache', 'profiling', 'run_analysis']
+
+# 计算路径上禁止加载的重量级模块
+FORBIDDEN_MODULES = ['matplotlib', 'seaborn', 'tabulate']
+
+
+def time_interpreter(code, repeat):
+    """在全新的解释器中执行code repeat次，返回耗时中位数（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=PROJECT_DIR, check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def loaded_forbidden_modules():
+    """导入计算路径模块后，返回已被加载的禁止模块"""
+    code = (
+        'import json, sys\n'
+        + ''.join(f'import {name}\n' for name in COMPUTE_MODULES)
+        + f'print(json.dumps(sorted(m for m in {FORBIDDEN_MODULES!r} if m in sys.modules)))'
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='计算路径启动耗时基准')
+    parser.add_argument('--repeat', type=int, default=5, help='每项测量的重复次数，默认5')
+    parser.add_argument('--budget', type=float, default=1.5,
+                        help='导入计算路径模块的耗时预算（秒，已扣除空解释器启动时间），默认1.5')
+    args = parser.parse_args()
+
+    baseline = time_interpreter('pass', args.repeat)
+    print(f"空解释器启动: {baseline * 1000:.0f} ms")
+
+    failed = False
+    for name in COMPUTE_MODULES:
+        elapsed = time_interpreter(f'import {name}', args.repeat) - baseline
+        print(f"import {name}: {elapsed * 1000:.0f} ms")
+        if elapsed > args.budget:
+            print(f"  超出预算 {args.budget * 1000:.0f} ms")
+            failed = True
+
+    forbidden = loaded_forbidden_modules()
+    if forbidden:
+        print(f"计算路径加载了重量级模块: {', '.join(forbidden)}")
+        failed = True
+    else:
+        print("计算路径未加载绘图等重量级模块")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
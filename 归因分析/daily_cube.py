@@ -0,0 +1,259 @@
+"""店铺 × 日期的每日数组存储：从train.csv构建一次，之后以内存映射方式读取
+
+每个度量/标记保存为一个(店铺数 × 天数)的.npy矩阵（Sales、Customers、Open、Promo、SchoolHoliday、
+StateHoliday编码以及表示该店当天有记录的Present），行按Store编号升序，列为连续的日期。
+按日期区间或连续的店铺区间切片都是零拷贝的数组视图，不需要过滤DataFrame；
+归因所需的周期立方体可以直接从这些矩阵汇总得到，结果与build_cube()对原始数据汇总完全一致。
+
+用法（在项目目录下运行）：
+    python daily_cube.py [train.csv]        # 构建（源文件未变化时跳过）
+    python sales_analysis.py --daily        # 从每日数组做归因
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from sales_analysis import (CHUNK_SIZE, CUBE_DIMS, TRAIN_DTYPES, attach_store_attributes, period_key,
+                            read_store_data, resolve_window)
+from sales_cache import (CACHE_DIR, file_fingerprint, fresh_directory, read_meta, replace_directory, same_sources,
+                         write_meta)
+
+# 每日数组的保存目录
+DAILY_DIR = os.path.join(CACHE_DIR, 'daily')
+
+# 存储格式版本，数组布局变化时递增以触发重建
+DAILY_VERSION = 1
+
+# 每日数组及其类型；StateHoliday保存为TRAIN_DTYPES中类别的编码
+DAILY_ARRAYS = {
+    'Sales': 'int32',
+    'Customers': 'int32',
+    'Open': 'int8',
+    'Promo': 'int8',
+    'SchoolHoliday': 'int8',
+    'StateHoliday': 'int8',
+    'Present': 'int8',
+}
+
+# 由每日数组汇总周期立方体时每批处理的店铺数（限制临时数组的内存）
+STORE_BLOCK = 4096
+
+# 可以从每日数组汇总的行级维度及其取值个数（StateHoliday为类别编码，DayOfWeek由日期得到）
+DAILY_DIMS = {'Promo': 2, 'SchoolHoliday': 2, 'StateHoliday': len(TRAIN_DTYPES['StateHoliday'].categories),
+              'DayOfWeek': 7}
+
+
+def _dim_codes(dim, take, dates):
+    """行级维度在一批店铺 × 窗口日期上的取值编码（从0开始）"""
+    if dim == 'DayOfWeek':
+        return dates.dayofweek.to_numpy()[None, :]
+    return take(dim).astype(np.int64)
+
+
+def _dim_values(dim, codes):
+    """把取值编码还原为与build_cube()相同类型的维度列"""
+    if dim == 'StateHoliday':
+        return pd.Categorical.from_codes(codes, dtype=TRAIN_DTYPES['StateHoliday'])
+    if dim == 'DayOfWeek':
+        return (codes + 1).astype('int8')
+    return codes.astype('int8')
+
+
+def build_daily_cube(train_path='train.csv', directory=DAILY_DIR, chunksize=CHUNK_SIZE):
+    """分块读取train.csv，写出店铺 × 日期的每日数组
+
+    第一遍只读Store和Date确定店铺集合和日期范围，第二遍把每行写入内存映射的矩阵，
+    峰值内存只取决于chunksize。先写到临时目录，完成后再替换，中途失败不会留下不完整的数组。
+    """
+    stores, first_date, last_date = set(), None, None
+    for chunk in pd.read_csv(train_path, usecols=['Store', 'Date'], dtype={'Date': str}, chunksize=chunksize):
+        stores.update(chunk['Store'].unique().tolist())
+        chunk_min, chunk_max = chunk['Date'].min(), chunk['Date'].max()
+        first_date = chunk_min if first_date is None else min(first_date, chunk_min)
+        last_date = chunk_max if last_date is None else max(last_date, chunk_max)
+    if first_date is None:
+        raise ValueError(f"{train_path} 中没有数据")
+
+    stores = np.array(sorted(stores), dtype=np.int32)
+    first_date = pd.Timestamp(first_date)
+    n_days = (pd.Timestamp(last_date) - first_date).days + 1
+    store_rows = np.full(stores.max() + 1, -1, dtype=np.int64)
+    store_rows[stores] = np.arange(len(stores))
+
+    tmp_dir = fresh_directory(directory)
+    np.save(os.path.join(tmp_dir, 'stores.npy'), stores)
+    arrays = {name: np.lib.format.open_memmap(os.path.join(tmp_dir, f'{name}.npy'), mode='w+',
+                                              dtype=dtype, shape=(len(stores), n_days))
+              for name, dtype in DAILY_ARRAYS.items()}
+
+    for chunk in pd.read_csv(train_path, dtype=TRAIN_DTYPES, chunksize=chunksize):
+        rows = store_rows[chunk['Store'].to_numpy()]
+        days = (pd.to_datetime(chunk['Date']) - first_date).dt.days.to_numpy()
+        for name in ['Sales', 'Customers', 'Open', 'Promo', 'SchoolHoliday']:
+            arrays[name][rows, days] = chunk[name].to_numpy()
+        arrays['StateHoliday'][rows, days] = chunk['StateHoliday'].cat.codes.to_numpy()
+        arrays['Present'][rows, days] = 1
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    meta = {
+        'version': DAILY_VERSION,
+        'first_date': first_date.strftime('%Y-%m-%d'),
+        'n_days': n_days,
+        'source': file_fingerprint(train_path),
+    }
+    write_meta(tmp_dir, meta)
+    replace_directory(tmp_dir, directory)
+
+
+def open_daily_cube(train_path='train.csv', directory=DAILY_DIR, rebuild=True):
+    """打开每日数组；不存在、版本不符或train.csv已变化时（rebuild为True时）先重建"""
+    meta = read_meta(directory)
+    fresh = meta is not None and meta.get('version') == DAILY_VERSION
+    if fresh:
+        fresh, _ = same_sources({'train': meta['source']}, {'train': train_path})
+    if not fresh:
+        if not rebuild:
+            raise RuntimeError(f"每日数组 {directory} 不存在或已过期，请先运行 python daily_cube.py")
+        print("正在构建店铺 × 日期的每日数组...")
+        build_daily_cube(train_path, directory)
+    return DailyCube(directory)
+
+
+class DailyCube:
+    """以内存映射方式打开的每日数组"""
+
+    def __init__(self, directory=DAILY_DIR):
+        meta = read_meta(directory)
+        if meta is None:
+            raise RuntimeError(f"每日数组 {directory} 不存在，请先运行 python daily_cube.py")
+        self.directory = directory
+        self.first_date = pd.Timestamp(meta['first_date'])
+        self.n_days = meta['n_days']
+        self.stores = np.load(os.path.join(directory, 'stores.npy'))
+        self.arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                       for name in DAILY_ARRAYS}
+
+    @property
+    def dates(self):
+        return pd.date_range(self.first_date, periods=self.n_days)
+
+    @property
+    def last_date(self):
+        return (self.first_date + pd.Timedelta(days=self.n_days - 1)).strftime('%Y-%m-%d')
+
+    def day_slice(self, start=None, end=None):
+        """[start, end]日期区间对应的列切片（日期为None表示不设限）"""
+        first = 0 if start is None else max((pd.Timestamp(start) - self.first_date).days, 0)
+        last = self.n_days if end is None else min((pd.Timestamp(end) - self.first_date).days + 1, self.n_days)
+        return slice(first, max(first, last))
+
+    def store_rows(self, stores=None):
+        """店铺编号对应的行号（升序），None为全部店铺；不存在的店铺被忽略"""
+        if stores is None:
+            return np.arange(len(self.stores))
+        return np.flatnonzero(np.isin(self.stores, stores))
+
+    def select(self, name, start=None, end=None, stores=None, rows=None):
+        """取出某个每日数组在日期区间和店铺子集上的部分
+
+        日期区间总是切片；店铺行连续时（全部店铺或编号区间）也是切片，结果为零拷贝视图，
+        否则按行号取出副本。rows为已知的行号，提供时忽略stores。
+        """
+        rows = self.store_rows(stores) if rows is None else rows
+        if len(rows) > 0 and rows[-1] - rows[0] + 1 == len(rows):
+            rows = slice(int(rows[0]), int(rows[-1]) + 1)
+        return self.arrays[name][rows, self.day_slice(start, end)]
+
+    def last_present_date(self, start=None, end=None):
+        """[start, end]内最后一个有记录的日期，没有记录时返回None"""
+        days = self.day_slice(start, end)
+        present = np.flatnonzero(self.arrays['Present'][:, days].any(axis=0))
+        if len(present) == 0:
+            return None
+        return self.dates[days.start + present[-1]].strftime('%Y-%m-%d')
+
+    def period_cube(self, freq='M', start=None, end=None, stores=None):
+        """汇总出与build_cube()相同粒度（周期 × Store × CUBE_DIMS中的行级维度）的度量，不含店铺属性
+
+        按店铺分批，对每批把(店铺, 周期, 各行级维度的取值)按混合进制编码为一个整数后用bincount汇总，
+        临时数组的大小只取决于STORE_BLOCK和窗口天数。
+        """
+        dims = [dim for dim in CUBE_DIMS if dim in TRAIN_DTYPES and dim != 'Store']
+        unsupported = [dim for dim in dims if dim not in DAILY_DIMS]
+        if unsupported:
+            raise ValueError(f"每日数组不支持行级维度 {', '.join(unsupported)}")
+        sizes = [DAILY_DIMS[dim] for dim in dims]
+        strides = [int(np.prod(sizes[i + 1:])) for i in range(len(dims))]
+        n_cells = int(np.prod(sizes))
+
+        days = self.day_slice(start, end)
+        dates = self.dates[days]
+        day_keys = period_key(pd.Series(dates), freq).to_numpy()
+        periods, day_period = np.unique(day_keys, return_inverse=True)
+        n_codes = len(periods) * n_cells
+        rows = self.store_rows(stores)
+
+        parts = []
+        for block in range(0, len(rows), STORE_BLOCK):
+            block_rows = rows[block:block + STORE_BLOCK]
+
+            def take(name):
+                return self.select(name, start, end, rows=block_rows)
+
+            present = take('Present').astype(bool)
+            codes = day_period[None, :] * n_cells + np.arange(len(block_rows))[:, None] * n_codes
+            for dim, stride in zip(dims, strides):
+                codes = codes + _dim_codes(dim, take, dates) * stride
+            codes = codes[present]
+            size = len(block_rows) * n_codes
+            counts = np.bincount(codes, minlength=size)
+            cells = np.flatnonzero(counts)
+            part = {'Store': self.stores[block_rows][cells // n_codes], 'Cell': cells % n_codes,
+                    'Days': counts[cells]}
+            for name in ['Sales', 'Customers', 'Open']:
+                part[name] = np.bincount(codes, weights=take(name)[present], minlength=size)[cells]
+            parts.append(part)
+
+        def combine(name):
+            return np.concatenate([part[name] for part in parts]) if parts else np.array([], dtype=np.int64)
+
+        cells = combine('Cell')
+        cube = pd.DataFrame({
+            'YearMonth': periods[cells // n_cells].astype('int32') if len(periods) else cells.astype('int32'),
+            'Store': combine('Store').astype('int32'),
+        })
+        for dim, size, stride in zip(dims, sizes, strides):
+            cube[dim] = _dim_values(dim, (cells // stride) % size)
+        for name in ['Sales', 'Customers', 'Open', 'Days']:
+            cube[name] = combine(name).astype('int64')
+        return cube
+
+
+def window_cube(daily, store_data, freq='M', start=None, end=None, stores=None):
+    """由已打开的每日数组汇总[start, end]内的周期立方体并附加店铺属性，列和行序与build_cube()一致"""
+    cube = daily.period_cube(freq, start, end, stores)
+    cube = attach_store_attributes(cube, store_data)
+    cube = cube[['YearMonth'] + CUBE_DIMS + ['Sales', 'Customers', 'Open', 'Days']]
+    return cube.sort_values(['YearMonth'] + CUBE_DIMS, ignore_index=True)
+
+
+def load_period_cube(freq='M', n_periods=4, start=None, end=None, train_path='train.csv',
+                     store_path='store.csv', directory=DAILY_DIR):
+    """从每日数组得到分析窗口内的周期立方体（与build_cube(load_data(...))一致），返回(立方体, 最大日期)"""
+    daily = open_daily_cube(train_path, directory)
+    window_start, window_end = resolve_window(train_path, freq, n_periods, start, end, max_date=daily.last_date)
+    cube = window_cube(daily, read_store_data(store_path), freq, window_start, window_end)
+    if len(cube) == 0:
+        raise ValueError(f"窗口 {window_start} ~ {window_end or '最新'} 内没有数据")
+    return cube, daily.last_present_date(window_start, window_end)
+
+
+if __name__ == "__main__":
+    import sys
+
+    open_daily_cube(sys.argv[1] if len(sys.argv) > 1 else 'train.csv')
+    print(f"每日数组已保存到 {DAILY_DIR}")
@@ -0,0 +1,193 @@
+"""超出内存的历史数据：按月分区存储，流式汇总出聚合立方体
+
+train.csv分块读取一遍，按日期所在月份写成分区文件（cache/partitions/<YYYY-MM>/part-<n>.parquet，
+未安装pyarrow时为.pkl）。归因时只读取与分析窗口重叠的月份分区，逐个文件预处理并汇总为部分立方体，
+再用merge_cubes()合并；部分立方体的行数只取决于维度取值组合数，峰值内存只取决于单个分区文件和
+立方体的大小，与历史总行数无关。汇总结果与build_cube(load_data(...))完全一致。
+
+并行汇总（sales_analysis.py --workers N）也基于这些分区：每个进程自己读取并预处理分到的月份
+（或店铺区间），只把部分立方体传回父进程合并。
+
+源数据可以是多个CSV（如多个国家或多段历史），各文件的行追加到同一套月份分区中。
+
+用法（在项目目录下运行）：
+    python out_of_core.py [train.csv ...]            # 构建分区（源文件未变化时跳过）
+    python sales_analysis.py --out-of-core          # 流式汇总后做归因
+    python sales_analysis.py --workers 4            # 4个进程分别汇总各自的分区后合并
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from sales_analysis import (CHUNK_SIZE, TRAIN_DTYPES, build_cube, merge_cubes, preprocess,
+                            read_store_data, resolve_window)
+from sales_cache import (CACHE_DIR, CACHE_FORMAT, PartitionWriter, file_fingerprint, fresh_directory, read_frame,
+                         read_meta, replace_directory, same_sources, write_meta)
+
+# 月份分区的保存目录
+PARTITION_DIR = os.path.join(CACHE_DIR, 'partitions')
+
+# 分区格式版本，布局变化时递增以触发重建
+PARTITION_VERSION = 3
+
+# 分区文件保留的列（train.csv的全部列，任何行级维度都可以加入立方体）
+PARTITION_COLUMNS = list(TRAIN_DTYPES)
+
+# 累积多少个部分立方体后合并一次（限制待合并部分立方体的内存）
+MERGE_EVERY = 16
+
+
+def partition_train(sources, directory=PARTITION_DIR, chunksize=CHUNK_SIZE):
+    """分块读取各源CSV，把各块的行按月份缓冲后写成分区文件
+
+    同一月份的行在内存中累积后再写出（见sales_cache.PartitionWriter），源文件没有按日期排序时
+    也不会产生块数 × 月份数个小文件。先写到临时目录，完成后再替换，中途失败不会留下不完整的分区。
+    """
+    tmp_dir = fresh_directory(directory)
+    writer = PartitionWriter(tmp_dir)
+    rows, first_date, last_date = 0, None, None
+    with profiling.stage('partition_train') as record:
+        for path in sources:
+            for chunk in pd.read_csv(path, usecols=PARTITION_COLUMNS, dtype=TRAIN_DTYPES, chunksize=chunksize):
+                rows += len(chunk)
+                chunk_min, chunk_max = chunk['Date'].min(), chunk['Date'].max()
+                first_date = chunk_min if first_date is None else min(first_date, chunk_min)
+                last_date = chunk_max if last_date is None else max(last_date, chunk_max)
+                writer.add(chunk[PARTITION_COLUMNS], chunk['Date'].str[:7])
+        months = writer.close()
+        record['rows_in'] = rows
+    if first_date is None:
+        raise ValueError(f"{', '.join(sources)} 中没有数据")
+
+    meta = {
+        'version': PARTITION_VERSION,
+        'format': CACHE_FORMAT,
+        'first_date': first_date,
+        'last_date': last_date,
+        'rows': rows,
+        'sources': {path: file_fingerprint(path) for path in sources},
+        'months': months,
+    }
+    write_meta(tmp_dir, meta)
+    replace_directory(tmp_dir, directory)
+    return meta
+
+
+def open_partitions(sources, directory=PARTITION_DIR, rebuild=True):
+    """返回分区的元数据；不存在、版本不符或源文件已变化时（rebuild为True时）先重建"""
+    meta = read_meta(directory)
+    fresh = meta is not None and meta.get('version') == PARTITION_VERSION
+    if fresh:
+        fresh, _ = same_sources(meta['sources'], {path: path for path in sources})
+    if not fresh:
+        if not rebuild:
+            raise RuntimeError(f"分区 {directory} 不存在或已过期，请先运行 python out_of_core.py")
+        print("正在按月份分区写出源数据...")
+        meta = partition_train(sources, directory)
+    return meta
+
+
+def window_files(meta, start=None, end=None):
+    """与[start, end]日期区间重叠的月份分区文件"""
+    first = None if start is None else start[:7]
+    last = None if end is None else end[:7]
+    return [name for month, files in meta['months'].items()
+            if (first is None or month >= first) and (last is None or month <= last) for name in files]
+
+
+def _partial_cube(names, meta, freq='M', start=None, end=None, store_path='store.csv',
+                  directory=PARTITION_DIR, store_bounds=None, store_part=0):
+    """读取并预处理names中的分区文件，汇总为部分立方体，返回(部分立方体, 最大日期, 行数)
+
+    store_bounds为各店铺区间的上界时只保留第store_part个区间内的店铺。
+    在进程池中运行时每个进程自己读取分区文件，只把部分立方体传回父进程。
+    窗口内没有数据时部分立方体为None。
+    """
+    store_data = read_store_data(store_path)
+    cube, partials, max_date, rows = None, [], None, 0
+    for name in names:
+        part = read_frame(os.path.join(directory, name), meta['format'])
+        if start is not None:
+            part = part[part['Date'] >= start]
+        if end is not None:
+            part = part[part['Date'] <= end]
+        if store_bounds is not None:
+            part_ids = np.minimum(np.searchsorted(store_bounds, part['Store'].to_numpy()), len(store_bounds) - 1)
+            part = part[part_ids == store_part]
+        if len(part) == 0:
+            continue
+        rows += len(part)
+        part_max = part['Date'].max()
+        max_date = part_max if max_date is None else max(max_date, part_max)
+        partials.append(build_cube(preprocess(part, store_data, freq)))
+        if len(partials) >= MERGE_EVERY:
+            cube = merge_cubes(partials if cube is None else [cube] + partials)
+            partials = []
+    if partials:
+        cube = merge_cubes(partials if cube is None else [cube] + partials)
+    return cube, max_date, rows
+
+
+def _worker_tasks(files, workers, partition_by, store_path):
+    """把窗口内的分区文件分给workers个进程，返回各进程的(文件列表, 店铺区间上界, 区间序号)
+
+    partition_by为period时按月份把分区文件分成连续的几组；为store时各进程读取全部文件，
+    按店铺区间只预处理和汇总自己的店铺。
+    """
+    if partition_by == 'period':
+        months = list(dict.fromkeys(os.path.dirname(name) for name in files))
+        groups = [set(chunk) for chunk in np.array_split(np.array(months, dtype=object), workers) if len(chunk) > 0]
+        return [([name for name in files if os.path.dirname(name) in group], None, 0) for group in groups]
+    stores = np.sort(read_store_data(store_path)['Store'].unique())
+    bounds = [chunk[-1] for chunk in np.array_split(stores, workers) if len(chunk) > 0]
+    return [(files, bounds, index) for index in range(len(bounds))]
+
+
+def stream_cube(freq='M', start=None, end=None, meta=None, store_path='store.csv', directory=PARTITION_DIR,
+                workers=1, partition_by='store'):
+    """逐个读取窗口内的分区文件，汇总为部分立方体后合并，返回(立方体, 窗口内的最大日期)
+
+    workers大于1时按partition_by（store或period）把分区分给进程池，各进程自己读取、预处理并汇总，
+    父进程只合并各进程返回的部分立方体。
+    """
+    files = window_files(meta, start, end)
+    with profiling.stage('stream_cube') as record:
+        if workers > 1 and files:
+            from concurrent.futures import ProcessPoolExecutor
+
+            tasks = _worker_tasks(files, workers, partition_by, store_path)
+            with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+                futures = [pool.submit(_partial_cube, names, meta, freq, start, end, store_path, directory,
+                                       bounds, index) for names, bounds, index in tasks]
+                results = [future.result() for future in futures]
+        else:
+            results = [_partial_cube(files, meta, freq, start, end, store_path, directory)]
+        partials = [cube for cube, _, _ in results if cube is not None]
+        if not partials:
+            raise ValueError(f"窗口 {start} ~ {end or '最新'} 内没有数据")
+        cube = partials[0] if len(partials) == 1 else merge_cubes(partials)
+        max_date = max(date for _, date, _ in results if date is not None)
+        record['rows_in'] = sum(rows for _, _, rows in results)
+        record['rows_out'] = len(cube)
+    return cube, max_date
+
+
+def load_period_cube(freq='M', n_periods=4, start=None, end=None, sources=('train.csv',),
+                     store_path='store.csv', directory=PARTITION_DIR, workers=1, partition_by='store'):
+    """从月份分区流式得到分析窗口内的周期立方体（与build_cube(load_data(...))一致），返回(立方体, 最大日期)
+
+    workers大于1时各进程分别读取和汇总自己的分区，见stream_cube()。
+    """
+    sources = list(sources)
+    meta = open_partitions(sources, directory)
+    window_start, window_end = resolve_window(sources[0], freq, n_periods, start, end, max_date=meta['last_date'])
+    return stream_cube(freq, window_start, window_end, meta, store_path, directory, workers, partition_by)
+
+
+if __name__ == "__main__":
+    import sys
+
+    meta = open_partitions(sys.argv[1:] or ['train.csv'])
+    print(f"{meta['rows']} 行已按 {len(meta['months'])} 个月份分区保存到 {PARTITION_DIR}")
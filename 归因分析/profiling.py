@@ -0,0 +1,194 @@
+"""分阶段性能追踪：记录各阶段的耗时、CPU时间、输入输出行数和内存峰值
+
+用法：
+    import profiling
+
+    with profiling.stage('read_train') as record:
+        data = ...
+        record['rows_out'] = len(data)
+
+    profiling.write_trace('output/trace.json')   # 扩展名为.csv时写CSV
+
+阶段可以嵌套，记录中的parent为外层阶段名。每条记录包含：
+    wall_s       墙钟耗时（秒）
+    cpu_s        本进程的CPU时间（秒，不含子进程）
+    rows_in/out  输入/输出行数（由调用方填写，可为空）
+    peak_rss_mb  到该阶段结束为止进程RSS的最高水位（MB）
+    alloc_peak_mb 阶段内Python/NumPy分配的内存峰值（MB，仅在start_memory_tracing()之后记录）
+
+本模块只依赖标准库，导入时不会加载pandas等重量级模块。
+"""
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows上没有resource模块，此时不记录RSS
+    resource = None
+
+# 追踪记录的字段（同时也是CSV的列顺序）
+TRACE_FIELDS = ['name', 'parent', 'thread', 'start_s', 'wall_s', 'cpu_s', 'rows_in', 'rows_out',
+                'peak_rss_mb', 'alloc_peak_mb']
+
+# 支持的剖析器
+PROFILERS = ['cprofile', 'pyinstrument']
+
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+def peak_rss_mb():
+    """当前进程RSS的最高水位（MB），没有resource模块（Windows）时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux上单位为KB，macOS上为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def reset():
+    """清空已有的追踪记录，并以当前时刻作为start_s的起点"""
+    global _origin
+    with _lock:
+        _records.clear()
+        _origin = time.perf_counter()
+
+
+def records():
+    """返回已完成阶段的追踪记录（按完成顺序）"""
+    with _lock:
+        return [dict(record) for record in _records]
+
+
+def start_memory_tracing():
+    """开始用tracemalloc记录各阶段的内存分配峰值（会明显拖慢运行，仅在排查内存问题时使用）"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """追踪一个阶段，返回的记录中可以在阶段内填写rows_in和rows_out"""
+    stack = _stack()
+    record = {'name': name, 'parent': stack[-1]['name'] if stack else None,
+              'thread': threading.current_thread().name, 'rows_in': rows_in, 'rows_out': None,
+              'alloc_peak_mb': None}
+
+    # 外层阶段的分配峰值在重置前先记下，内层结束后再并入
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        if stack:
+            stack[-1]['_alloc_peak'] = max(stack[-1]['_alloc_peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        record['_alloc_peak'] = 0
+
+    stack.append(record)
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record['wall_s'] = time.perf_counter() - start_wall
+        record['cpu_s'] = time.process_time() - start_cpu
+        record['start_s'] = start_wall - _origin
+        record['peak_rss_mb'] = peak_rss_mb()
+        stack.pop()
+        if tracing and tracemalloc.is_tracing():
+            peak = max(record.pop('_alloc_peak'), tracemalloc.get_traced_memory()[1])
+            record['alloc_peak_mb'] = peak / (1024 * 1024)
+            if stack:
+                stack[-1]['_alloc_peak'] = max(stack[-1]['_alloc_peak'], peak)
+        record.pop('_alloc_peak', None)
+        with _lock:
+            _records.append(record)
+
+
+def write_trace(path):
+    """将追踪记录写入path：扩展名为.csv时写CSV，否则写JSON"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    rows = records()
+    if path.endswith('.csv'):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TRACE_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+def print_trace(file=None):
+    """以缩进表格打印追踪记录（按开始时间排序，子阶段缩进在父阶段之下）"""
+    rows = sorted(records(), key=lambda record: record['start_s'])
+    depth = {}
+    print(f"\n{'阶段':<32} {'耗时(秒)':>9} {'CPU(秒)':>9} {'输入行数':>10} {'输出行数':>10} {'峰值RSS(MB)':>11}",
+          file=file)
+    for record in rows:
+        depth[record['name']] = depth.get(record['parent'], -1) + 1
+        name = '  ' * depth[record['name']] + record['name']
+        rows_in = '' if record['rows_in'] is None else record['rows_in']
+        rows_out = '' if record['rows_out'] is None else record['rows_out']
+        rss = '' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.1f}"
+        print(f"{name:<32} {record['wall_s']:9.3f} {record['cpu_s']:9.3f} {rows_in:>10} {rows_out:>10} {rss:>11}",
+              file=file)
+
+
+@contextmanager
+def profiler(kind, path):
+    """在with块内运行剖析器，结束后把结果写到path
+
+    剖析器只采样当前线程，在线程池中运行的代码需要在各自的线程内分别剖析。
+    kind为cprofile（写出pstats文件，可用snakeviz等查看）或pyinstrument（写出HTML，需安装pyinstrument）。
+    """
+    if kind not in PROFILERS:
+        raise ValueError(f"不支持的剖析器: {kind}，可选: {', '.join(PROFILERS)}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if kind == 'cprofile':
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+        return
+
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        raise RuntimeError("未安装pyinstrument，请先运行 pip install pyinstrument 或改用 --profile cprofile")
+    profile = Profiler()
+    profile.start()
+    try:
+        yield
+    finally:
+        profile.stop()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profile.output_html())
+
+
+def profile_path(kind, output_dir='output', name=None):
+    """剖析结果的默认保存路径，name用于区分同一次运行中分别剖析的多个阶段"""
+    stem = 'profile' if name is None else f'profile_{name}'
+    return os.path.join(output_dir, stem + ('.prof' if kind == 'cprofile' else '.html'))
@@ -0,0 +1,324 @@
+"""结论文档渲染：模板只解析一次，占位符一遍填充；支持按店铺类型、店铺等分段批量生成报告
+
+模板中的占位符形如 {MONTH_LIST}，编译后的模板是文字片段与占位符名交替的列表，
+渲染时一次拼接完成，不再对整篇文档反复做str.replace。填入的内容不会被再次当作占位符解析。
+
+批量生成时，所有分段（如每种店铺类型、每家店铺）的结果表把分段列作为额外维度，
+从同一个聚合立方体一次算出，再按分段切分；各报告在进程池中并行渲染，各进程只编译一次模板。
+
+用法（在项目目录下运行）：
+    python report_renderer.py --by StoreType
+    python report_renderer.py --by Store --workers 4 --periods 6
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# 占位符：花括号中的大写字母、数字和下划线
+PLACEHOLDER = re.compile(r'\{([A-Z][A-Z0-9_]*)\}')
+
+# 默认模板
+TEMPLATE_PATH = 'analysis_conclusion.md'
+
+# 结论文档需要的结果表
+CONCLUSION_TABLES = ['monthly_sales', 'contribution_analysis', 'store_type_contribution',
+                     'promo_contribution', 'holiday_contribution']
+
+# 建议条数
+N_RECOMMENDATIONS = 4
+
+
+class Template:
+    """编译后的模板：literals比fields多一项，渲染时交替拼接"""
+
+    def __init__(self, text):
+        pieces = PLACEHOLDER.split(text)
+        self.literals = pieces[0::2]
+        self.fields = pieces[1::2]
+
+    def render(self, values):
+        """一遍填充占位符；values中没有的占位符保持原样"""
+        out = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            value = values.get(field)
+            out.append('{' + field + '}' if value is None else str(value))
+            out.append(literal)
+        return ''.join(out)
+
+
+@lru_cache(maxsize=8)
+def _compile(path, mtime_ns):
+    with open(path, 'r', encoding='utf-8') as f:
+        return Template(f.read())
+
+
+def load_template(path=TEMPLATE_PATH):
+    """读取并编译模板，文件未修改时直接返回已编译的模板"""
+    return _compile(path, os.stat(path).st_mtime_ns)
+
+
+def format_table(df):
+    """格式化DataFrame为Markdown表格"""
+    return df.to_markdown(index=False)
+
+
+def _contribution_table(df, column):
+    """把维度贡献度表整理为（周期 × 维度取值）的贡献率表格"""
+    table = df.set_index(['Current_Month', column])['Contribution_Pct'].unstack(column).reset_index()
+    table.columns.name = None
+    return format_table(table)
+
+
+def _ranked(df, latest_month):
+    """最近一个周期的维度贡献度，按贡献率从高到低排列"""
+    latest = df[df['Current_Month'] == latest_month]
+    return latest.sort_values('Contribution_Pct', ascending=False)
+
+
+def _top_findings(latest, column, template, second_template):
+    """最大（及第二大）贡献的描述"""
+    top = latest[column].iloc[0] if len(latest) > 0 else "无数据"
+    top_contrib = latest['Contribution_Pct'].iloc[0] if len(latest) > 0 else 0
+    findings = template.format(top, top_contrib)
+    if len(latest) > 1:
+        findings += second_template.format(latest[column].iloc[1], latest['Contribution_Pct'].iloc[1])
+    return top, findings
+
+
+def contribution_factors(results):
+    """最近一个周期各因素（客流量、客单价及各维度取值）的贡献率，返回[(因素名称, 贡献率)]"""
+    latest_contrib = results['contribution_analysis'].iloc[-1]
+    latest_month = results['monthly_sales']['YearMonth'].iloc[-1]
+    factors = [('客流量', latest_contrib['Customer_Contrib_Pct']),
+               ('客单价', latest_contrib['AvgTicket_Contrib_Pct'])]
+    for name, column, prefix in [('store_type_contribution', 'StoreType', '店铺类型-'),
+                                 ('promo_contribution', 'Promo_Label', ''),
+                                 ('holiday_contribution', 'Holiday_Label', '')]:
+        latest = _ranked(results[name], latest_month)
+        factors += [(f"{prefix}{value}", c) for value, c in zip(latest[column], latest['Contribution_Pct'])]
+    return factors
+
+
+def conclusion_values(results):
+    """由（已加上周期标签的）结果表计算结论模板中全部占位符的取值"""
+    monthly_sales = results['monthly_sales']
+    contribution_analysis = results['contribution_analysis']
+    store_type_contribution = results['store_type_contribution']
+    promo_contribution = results['promo_contribution']
+    holiday_contribution = results['holiday_contribution']
+    values = {}
+
+    # 月份列表及月度销售表格
+    months = monthly_sales['YearMonth'].tolist()
+    values['MONTH_LIST'] = ', '.join(months)
+    monthly_sales_display = monthly_sales[['YearMonth', 'Sales', 'Sales_MoM_Change', 'Sales_MoM_Change_Pct',
+                                           'Customers', 'AvgTicket']]
+    monthly_sales_display.columns = ['月份', '销售额', '环比变动额', '环比变动率(%)', '客流量', '客单价']
+    values['MONTHLY_SALES_TABLE'] = format_table(monthly_sales_display)
+
+    # 客流量与客单价分析
+    analysis = []
+    for row in contribution_analysis.itertuples(index=False):
+        text = (f"- **{row.Current_Month}相比{row.Prev_Month}**：销售额{('增长' if row.Sales_Change > 0 else '下降')}"
+                f"了{abs(row.Sales_Change):.2f}（{row.Sales_Change_Pct:.2f}%）。")
+        if abs(row.Customer_Contrib_Pct) > abs(row.AvgTicket_Contrib_Pct):
+            text += (f" 主要由**客流量**变化驱动（贡献率{row.Customer_Contrib_Pct:.2f}%），"
+                     f"客单价贡献为{row.AvgTicket_Contrib_Pct:.2f}%。")
+        else:
+            text += (f" 主要由**客单价**变化驱动（贡献率{row.AvgTicket_Contrib_Pct:.2f}%），"
+                     f"客流量贡献为{row.Customer_Contrib_Pct:.2f}%。")
+        analysis.append(text + "\n\n")
+    values['CUSTOMER_PRICE_ANALYSIS'] = ''.join(analysis)
+
+    # 最新周期的贡献度
+    latest_contrib = contribution_analysis.iloc[-1]
+    values['CUSTOMER_CONTRIBUTION'] = f"{latest_contrib['Customer_Contrib_Pct']:.2f}%"
+    values['TICKET_CONTRIBUTION'] = f"{latest_contrib['AvgTicket_Contrib_Pct']:.2f}%"
+    values['CROSS_CONTRIBUTION'] = f"{latest_contrib['Cross_Contrib_Pct']:.2f}%"
+
+    # 店铺类型贡献及主要发现
+    latest_month = months[-1]
+    values['STORETYPE_CONTRIBUTION_TABLE'] = _contribution_table(store_type_contribution, 'StoreType')
+    latest_store = _ranked(store_type_contribution, latest_month)
+    top_store_type, store_findings = _top_findings(
+        latest_store, 'StoreType',
+        "分析显示，店铺类型 **{}** 对最近一个月环比变化的贡献最大，贡献率为 {:.2f}%。",
+        " 其次是店铺类型 **{}**，贡献率为 {:.2f}%。")
+    for title, part in [('正向', latest_store[latest_store['Contribution_Pct'] > 0]),
+                        ('负向', latest_store[latest_store['Contribution_Pct'] < 0])]:
+        if not part.empty:
+            store_findings += f"\n\n{title}贡献的店铺类型有: " + ", ".join(
+                [f"**{t}** ({c:.2f}%)" for t, c in zip(part['StoreType'], part['Contribution_Pct'])])
+    values['STORE_TYPE_FINDINGS'] = store_findings
+
+    # 促销与假期贡献及主要发现
+    for key, df, column in [('PROMO', promo_contribution, 'Promo_Label'),
+                            ('HOLIDAY', holiday_contribution, 'Holiday_Label')]:
+        values[f'{key}_CONTRIBUTION_TABLE'] = _contribution_table(df, column)
+        values[f'{key}_FINDINGS'] = _top_findings(
+            _ranked(df, latest_month), column,
+            "分析显示，**{}**时段对最近一个月环比变化的贡献最大，贡献率为 {:.2f}%。",
+            " 其次是**{}**时段，贡献率为 {:.2f}%。")[1]
+
+    values['LATEST_MONTH'] = latest_month
+    values['PREV_MONTH'] = months[-2]
+
+    # 主要贡献因素排名：合并各维度的贡献度，按绝对值排序
+    all_dimensions = contribution_factors(results)
+    all_dimensions.sort(key=lambda x: abs(x[1]), reverse=True)
+    for i, name in enumerate(['TOP', 'SECOND', 'THIRD']):
+        factor, contribution = all_dimensions[i] if len(all_dimensions) > i else ("无数据", 0)
+        values[f'{name}_FACTOR'] = factor
+        values[f'{name}_CONTRIBUTION'] = f"{contribution:.2f}"
+
+    # 业务建议
+    top_factor = values['TOP_FACTOR']
+    recommendations = [
+        "加强客流引导措施，如开展会员营销活动、增加引流促销，提高客流量"
+        if latest_contrib['Customer_Contrib_Pct'] < 0 else
+        "巩固现有客流引导策略，同时关注客单价提升，增加商品交叉销售",
+        "优化商品结构，增加高客单价商品的推广力度，提升客单价"
+        if latest_contrib['AvgTicket_Contrib_Pct'] < 0 else
+        "维持当前客单价优势，可考虑推出套餐或捆绑销售策略，进一步提升客单价",
+    ]
+    if top_store_type != "无数据":
+        recommendations.append(f"重点关注店铺类型 {top_store_type} 的运营策略，分析其成功经验并推广到其他类型店铺")
+    if "促销" in top_factor:
+        recommendations.append("当前促销策略效果良好，建议优化促销商品结构和促销力度，进一步提升促销效率")
+    else:
+        recommendations.append("检视现有促销策略有效性，考虑调整促销频次、力度或商品范围，提高促销对销售的拉动作用")
+    if "假期" in top_factor:
+        recommendations.append("针对学校假期时段，制定专门的营销策略，如学生特惠、亲子活动等，进一步利用假期效应")
+    recommendations += ["定期分析销售数据，及时调整经营策略，持续优化销售表现"] * N_RECOMMENDATIONS
+    for i, text in enumerate(recommendations[:N_RECOMMENDATIONS]):
+        values[f'RECOMMENDATION_{i + 1}'] = text
+    return values
+
+
+def render_conclusion(results, template_path=TEMPLATE_PATH):
+    """渲染一份结论文档，返回Markdown文本"""
+    return load_template(template_path).render(conclusion_values(results))
+
+
+def conclusion_tables(cube, freq='M', compare='mom'):
+    """由聚合立方体计算结论文档需要的结果表（已加上周期标签）"""
+    from sales_analysis import (DIMENSION_ANALYSES, comparison_lag, customer_ticket_contribution,
+                                dimension_contribution, label_dimension, summarize_periods, with_period_labels)
+
+    lag = comparison_lag(freq, compare)
+    tables = {'monthly_sales': summarize_periods(cube, lag)}
+    tables['contribution_analysis'] = customer_ticket_contribution(tables['monthly_sales'], lag)
+    total_sales_change = tables['monthly_sales'].set_index('YearMonth')['Sales_MoM_Change']
+    for dims, _, name, labels in DIMENSION_ANALYSES:
+        tables[name] = label_dimension(dimension_contribution(cube, dims, total_sales_change, lag), dims, labels)
+    return {name: with_period_labels(df, freq) for name, df in tables.items()}
+
+
+def segment_tables(cube, by, freq='M', compare='mom'):
+    """一次计算所有分段的结论结果表，返回{分段取值: 结果表（已加上周期标签）}
+
+    各周期汇总按 分段 × 周期 一次完成；维度贡献度把分段列作为额外维度对整个立方体只计算一次，
+    贡献率按各分段自己的总体变动额计算。每个分段的结果表与conclusion_tables()对该分段的立方体计算的相同。
+    """
+    import numpy as np
+    import pandas as pd
+    from sales_analysis import (DIMENSION_ANALYSES, comparison_lag, customer_ticket_contribution,
+                                dimension_contribution, label_dimension, summarize_periods, with_period_labels)
+
+    lag = comparison_lag(freq, compare)
+    tables = {'monthly_sales': summarize_periods(cube, lag, by)}
+    tables['contribution_analysis'] = customer_ticket_contribution(tables['monthly_sales'], lag, by)
+    totals = tables['monthly_sales'].set_index([by, 'YearMonth'])['Sales_MoM_Change']
+    # 分段列本身是分析维度时（如按StoreType分段），维度表中保留该列
+    keep = set()
+    for dims, _, name, labels in DIMENSION_ANALYSES:
+        if by in dims:
+            keep.add(name)
+        result = dimension_contribution(cube, list(dict.fromkeys([by] + dims)), pd.Series(dtype=float), lag)
+        # 只保留两个周期都在本分段周期范围内的对，总体变动额换成本分段的
+        total = totals.reindex(pd.MultiIndex.from_arrays([result[by], result['Current_Month']])).to_numpy()
+        result = result[~np.isnan(total)].reset_index(drop=True)
+        total = total[~np.isnan(total)]
+        result['Total_Sales_Change'] = total
+        result['Contribution_Pct'] = np.divide(result['Sales_Change'].to_numpy(), total,
+                                               out=np.zeros(len(total)), where=total != 0) * 100
+        tables[name] = label_dimension(result, list(dict.fromkeys([by] + dims)), labels)
+
+    # 各表的行都按分段列排序，每个分段是一段连续的行，按位置切分；分段没有行的表为空表
+    segments, empty = {value: {} for value in tables['monthly_sales'][by].unique()}, {}
+    for name, df in tables.items():
+        df = with_period_labels(df, freq)
+        keys = df[by].to_numpy()
+        if name not in keep:
+            df = df.drop(columns=by)
+        empty[name] = df.iloc[:0]
+        if len(df) == 0:
+            continue
+        bounds = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1], True])
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            segments[keys[start]][name] = df.iloc[start:stop].reset_index(drop=True)
+    return {value: {name: parts.get(name, empty[name]) for name in tables} for value, parts in segments.items()}
+
+
+def _render_segment(task):
+    """进程池任务：渲染一个分段的报告并写出，返回(分段取值, 路径或错误信息)"""
+    value, tables, template_path, path = task
+    try:
+        text = render_conclusion(tables, template_path)
+    except (IndexError, KeyError, ValueError) as e:
+        return value, f"失败: {e}"
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return value, path
+
+
+def render_segment_reports(cube, by, freq='M', compare='mom', output_dir=os.path.join('output', 'reports'),
+                           template_path=TEMPLATE_PATH, workers=1):
+    """按by列（如StoreType、Store，或用attach_store_attributes附加的Assortment）分段批量生成结论文档
+
+    各分段的结果表由segment_tables()一次算出，每个分段的报告写入output_dir/<by>_<取值>.md，
+    workers大于1时在进程池中并行渲染。返回{分段取值: 报告路径或失败原因}。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(value, tables, template_path, os.path.join(output_dir, f'{by}_{value}.md'))
+             for value, tables in segment_tables(cube, by, freq, compare).items()]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return dict(pool.map(_render_segment, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    return dict(map(_render_segment, tasks))
+
+
+def main():
+    import argparse
+    import time
+
+    import sales_analysis as sa
+
+    parser = argparse.ArgumentParser(description='按分段批量生成结论文档')
+    parser.add_argument('--by', default='StoreType',
+                        help='分段列：立方体中的列（StoreType、Store、Promo、SchoolHoliday）或store.csv中的店铺属性，默认StoreType')
+    parser.add_argument('--freq', choices=sa.FREQ_CHOICES, default='M', help='周期粒度，默认M')
+    parser.add_argument('--compare', choices=list(sa.COMPARE_LABELS), default='mom', help='对比方式，默认mom')
+    parser.add_argument('--periods', type=int, default=sa.N_PERIODS, help=f'分析的周期数，默认{sa.N_PERIODS}')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数，默认1')
+    parser.add_argument('--output-dir', default=os.path.join('output', 'reports'), help='输出目录，默认output/reports')
+    args = parser.parse_args()
+
+    start = time.time()
+    cube = sa.build_cube(sa.load_data(args.freq, sa.window_periods(args.periods, args.freq, args.compare)))
+    try:
+        sa.check_comparable(cube, args.freq, args.compare)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.by not in cube.columns:
+        cube = sa.attach_store_attributes(cube, sa.read_store_data('store.csv', [args.by]), [args.by])
+    reports = render_segment_reports(cube, args.by, args.freq, args.compare, args.output_dir, workers=args.workers)
+    failed = {value: reason for value, reason in reports.items() if reason.startswith('失败')}
+    for value, reason in failed.items():
+        print(f"{args.by}={value}: {reason}")
+    print(f"已生成 {len(reports) - len(failed)} 份报告到 {args.output_dir}，用时 {time.time() - start:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,287 +1,1124 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import datetime
-import calendar
+import math
 import os
 
-# 确保输出文件夹存在
-if not os.path.exists('output'):
-    os.makedirs('output')
-
-# 1. 读取数据
-print("正在读取数据...")
-train_data = pd.read_csv('train.csv')
-store_data = pd.read_csv('store.csv')
-
-# 2. 数据预处理
-print("正在处理数据...")
-# 转换日期列为datetime类型
-train_data['Date'] = pd.to_datetime(train_data['Date'])
-
-# 提取年份和月份信息
-train_data['Year'] = train_data['Date'].dt.year
-train_data['Month'] = train_data['Date'].dt.month
-train_data['MonthName'] = train_data['Date'].dt.strftime('%b')
-train_data['YearMonth'] = train_data['Date'].dt.strftime('%Y-%m')
-
-# 与店铺信息合并
-data = pd.merge(train_data, store_data, on='Store', how='left')
-
-# 计算客单价
-data['AvgTicket'] = data['Sales'] / data['Customers']
-
-# 3. 筛选最近四个月数据
-recent_months = sorted(data['YearMonth'].unique())[-4:]
-recent_data = data[data['YearMonth'].isin(recent_months)]
-
-print(f"分析的月份: {recent_months}")
-
-# 4. 计算月度环比变化
-# 按月汇总销售数据
-monthly_sales = recent_data.groupby('YearMonth').agg({
-    'Sales': 'sum',
-    'Customers': 'sum',
-    'Open': 'sum'  # 开门天数总和
-}).reset_index()
-
-# 计算月度环比变化
-monthly_sales['Sales_MoM_Change'] = monthly_sales['Sales'].diff()
-monthly_sales['Sales_MoM_Change_Pct'] = monthly_sales['Sales'].pct_change() * 100
-monthly_sales['Customers_MoM_Change'] = monthly_sales['Customers'].diff()
-monthly_sales['Customers_MoM_Change_Pct'] = monthly_sales['Customers'].pct_change() * 100
-
-# 计算平均客单价
-monthly_sales['AvgTicket'] = monthly_sales['Sales'] / monthly_sales['Customers']
-monthly_sales['AvgTicket_MoM_Change'] = monthly_sales['AvgTicket'].diff()
-monthly_sales['AvgTicket_MoM_Change_Pct'] = monthly_sales['AvgTicket'].pct_change() * 100
-
-print("\n月度总体销售情况及环比变化:")
-print(monthly_sales[['YearMonth', 'Sales', 'Sales_MoM_Change', 'Sales_MoM_Change_Pct', 
-                   'Customers', 'AvgTicket']])
-
-# 5. 保存月度总体数据到CSV
-monthly_sales.to_csv('output/monthly_sales.csv', index=False)
-
-# 6. 客流与客单价贡献度分析
-print("\n正在分析客流量与客单价贡献度...")
-contribution_results = []
-
-# 最近三个月的环比分析
-for i in range(1, len(monthly_sales)):
-    current_month = monthly_sales.iloc[i]['YearMonth']
-    prev_month = monthly_sales.iloc[i-1]['YearMonth']
-    
-    # 本月与上月的销售额和客流量
-    current_sales = monthly_sales.iloc[i]['Sales']
-    prev_sales = monthly_sales.iloc[i-1]['Sales']
-    current_customers = monthly_sales.iloc[i]['Customers']
-    prev_customers = monthly_sales.iloc[i-1]['Customers']
-    
-    # 本月与上月的客单价
-    current_avg_ticket = monthly_sales.iloc[i]['AvgTicket']
-    prev_avg_ticket = monthly_sales.iloc[i-1]['AvgTicket']
-    
+import profiling
+from sales_cache import load_cache, read_cache, save_cache, load_state, save_state, ResultCache
+
+# 未指定起始日期时分析的周期数（最近N个周期）
+N_PERIODS = 4
+
+# 支持的周期粒度：W=周（周一开始）, M=月, Q=季度
+FREQ_CHOICES = ['W', 'M', 'Q']
+
+# 各粒度对应的pandas周期频率
+PANDAS_FREQS = {'W': 'W-SUN', 'M': 'M', 'Q': 'Q'}
+
+# 各粒度一年包含的周期数，用于同比对比（周按52周近似）
+PERIODS_PER_YEAR = {'W': 52, 'M': 12, 'Q': 4}
+
+# 对比方式：mom=与上一周期比（环比），yoy=与去年同期比（同比）
+COMPARE_LABELS = {'mom': '环比', 'yoy': '同比'}
+
+# 周键的起点（1970-01-05为周一）
+WEEK_ORIGIN = pd.Timestamp('1970-01-05')
+
+# 维度贡献度分析配置：(维度列, 名称, 输出名称, 取值标签列及映射)
+# 新增维度（如Assortment、StateHoliday、Promo2、DayOfWeek）只需在此添加一项：
+# 维度列自动加入聚合立方体（CUBE_DIMS），不在train.csv中的列作为店铺属性从store.csv附加（STORE_ATTRIBUTES）
+DIMENSION_ANALYSES = [
+    (['StoreType'], '店铺类型', 'store_type_contribution', None),
+    (['Promo'], '促销', 'promo_contribution', ('Promo_Label', {0: '无促销', 1: '有促销'})),
+    (['SchoolHoliday'], '假期', 'holiday_contribution', ('Holiday_Label', {0: '非学校假期', 1: '学校假期'})),
+]
+
+# 分块读取train.csv时每块的行数
+CHUNK_SIZE = 200000
+
+# train.csv各列的紧凑数据类型，Date保持为字符串以便在解析前按窗口过滤
+TRAIN_DTYPES = {
+    'Store': 'int32',
+    'DayOfWeek': 'int8',
+    'Date': str,
+    'Sales': 'int32',
+    'Customers': 'int32',
+    'Open': 'int8',
+    'Promo': 'int8',
+    'StateHoliday': pd.CategoricalDtype(['0', 'a', 'b', 'c']),
+    'SchoolHoliday': 'int8',
+}
+
+# 店铺级归因、Shapley分解和日历调整归因本身需要的立方体维度
+ATTRIBUTION_DIMS = ['Store', 'StoreType', 'Promo', 'SchoolHoliday']
+
+# 聚合立方体的最细粒度（不含周期）：归因需要的维度加上各分析维度，所有输出都从它再聚合得到
+CUBE_DIMS = list(dict.fromkeys(ATTRIBUTION_DIMS + [dim for dims, _, _, _ in DIMENSION_ANALYSES for dim in dims]))
+
+# 需要从store.csv附加到每行的店铺属性：立方体维度中不在train.csv里的列
+STORE_ATTRIBUTES = [dim for dim in CUBE_DIMS if dim not in TRAIN_DTYPES]
+
+
+def find_max_date(path, chunksize=CHUNK_SIZE):
+    """第一遍扫描：只读取Date列，找出数据中的最大日期"""
+    max_date = None
+    with profiling.stage('scan_max_date') as record:
+        record['rows_in'] = 0
+        for chunk in pd.read_csv(path, usecols=['Date'], dtype={'Date': str}, chunksize=chunksize):
+            record['rows_in'] += len(chunk)
+            chunk_max = chunk['Date'].max()
+            if max_date is None or chunk_max > max_date:
+                max_date = chunk_max
+    return max_date
+
+
+def resolve_window(path, freq='M', n_periods=N_PERIODS, start=None, end=None, max_date=None,
+                   chunksize=CHUNK_SIZE):
+    """确定读取的日期窗口，返回ISO格式的(start, end)，end为None表示不设上限
+
+    未指定start时，取end（或数据中的最大日期）所在周期及之前共n_periods个周期。
+    max_date为已知的最大日期（如上次运行时保存的值），未提供时先扫描一遍Date列。
+    """
+    if end is not None:
+        end = pd.Timestamp(end).strftime('%Y-%m-%d')
+    if start is None:
+        if end is None and max_date is None:
+            max_date = find_max_date(path, chunksize)
+        last_period = pd.Period(end or max_date, freq=PANDAS_FREQS[freq])
+        start = (last_period - (n_periods - 1)).start_time
+    return pd.Timestamp(start).strftime('%Y-%m-%d'), end
+
+
+def read_train_data(path, start=None, end=None, chunksize=CHUNK_SIZE):
+    """分块读取train.csv，只保留[start, end]日期范围内的行
+
+    Date为ISO格式（YYYY-MM-DD），可以直接按字符串比较过滤，峰值内存只取决于窗口大小。
+    """
+    chunks = []
+    with profiling.stage('read_train') as record:
+        record['rows_in'] = 0
+        for chunk in pd.read_csv(path, dtype=TRAIN_DTYPES, chunksize=chunksize):
+            record['rows_in'] += len(chunk)
+            if start is not None:
+                chunk = chunk[chunk['Date'] >= start]
+            if end is not None:
+                chunk = chunk[chunk['Date'] <= end]
+            if len(chunk) > 0:
+                chunks.append(chunk)
+        if not chunks:
+            data = pd.read_csv(path, dtype=TRAIN_DTYPES, nrows=0)
+        else:
+            data = pd.concat(chunks, ignore_index=True)
+        record['rows_out'] = len(data)
+    return data
+
+
+def read_store_data(path, columns=None):
+    """读取store.csv中Store编号及分析需要的店铺属性列"""
+    columns = STORE_ATTRIBUTES if columns is None else columns
+    with profiling.stage('read_store') as record:
+        store_data = pd.read_csv(path, usecols=['Store'] + list(columns))
+        record['rows_out'] = len(store_data)
+    return store_data
+
+
+def attach_store_attributes(data, store_data, columns=None):
+    """按Store编号以数组下标方式为每行附加店铺属性
+
+    为每个属性构造以Store编号为下标的数组，字符串属性存为categorical编码，
+    数值属性存为float（缺失为NaN），只附加需要的列，避免整表合并复制全部店铺列。
+    store.csv中没有的店铺取缺失值，与左连接一致；data为空时只添加空的属性列。
+    """
+    columns = STORE_ATTRIBUTES if columns is None else columns
+    store_ids = store_data['Store'].to_numpy()
+    row_stores = data['Store'].to_numpy()
+    size = max(store_ids.max(initial=0), row_stores.max(initial=0)) + 1
+
+    for col in columns:
+        values = store_data[col]
+        if pd.api.types.is_numeric_dtype(values):
+            lookup = np.full(size, np.nan)
+            lookup[store_ids] = values.to_numpy(dtype=float)
+            data[col] = lookup[row_stores]
+        else:
+            categories = pd.Index(values.dropna().unique()).sort_values()
+            lookup = np.full(size, -1, dtype=np.int16)
+            lookup[store_ids] = categories.get_indexer(values)
+            data[col] = pd.Categorical.from_codes(lookup[row_stores], categories=categories)
+    return data
+
+
+def preprocess(train_data, store_data, freq='M'):
+    """解析日期、计算周期键并附加店铺属性"""
+    rows = len(train_data)
+
+    # 转换日期列为datetime类型
+    with profiling.stage('parse_dates', rows_in=rows):
+        train_data['Date'] = pd.to_datetime(train_data['Date'])
+
+    # 提取整数周期键，仅在输出时转换为标签
+    with profiling.stage('period_key', rows_in=rows):
+        train_data['YearMonth'] = period_key(train_data['Date'], freq)
+
+    # 附加分析需要的店铺属性
+    with profiling.stage('store_join', rows_in=rows) as record:
+        data = attach_store_attributes(train_data, store_data)
+        record['rows_out'] = len(data)
+    return data
+
+
+def period_key(dates, freq='M'):
+    """将日期转换为整数周期键，相邻周期的键相差1
+
+    月：year*12 + (month-1)；季度：year*4 + (quarter-1)；周：距WEEK_ORIGIN的周数。
+    """
+    if freq == 'M':
+        key = dates.dt.year * 12 + dates.dt.month - 1
+    elif freq == 'Q':
+        key = dates.dt.year * 4 + (dates.dt.month - 1) // 3
+    else:
+        key = (dates - WEEK_ORIGIN).dt.days // 7
+    return key.astype('int32')
+
+
+def format_period(key, freq='M'):
+    """将整数周期键转换为标签：月'YYYY-MM'，季度'YYYY-Qn'，周为周一的日期'YYYY-MM-DD'"""
+    key = int(key)
+    if freq == 'M':
+        year, month = divmod(key, 12)
+        return f"{year:04d}-{month + 1:02d}"
+    if freq == 'Q':
+        year, quarter = divmod(key, 4)
+        return f"{year:04d}-Q{quarter + 1}"
+    return (WEEK_ORIGIN + pd.Timedelta(weeks=key)).strftime('%Y-%m-%d')
+
+
+def with_period_labels(df, freq='M', columns=('YearMonth', 'Current_Month', 'Prev_Month')):
+    """返回将周期键列替换为标签后的副本，用于打印和写入CSV"""
+    df = df.copy()
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].map(lambda key: format_period(key, freq))
+    return df
+
+
+def comparison_lag(freq, compare):
+    """对比期与本期相差的周期数"""
+    return PERIODS_PER_YEAR[freq] if compare == 'yoy' else 1
+
+
+def window_periods(n_periods, freq='M', compare='mom'):
+    """未指定起始日期时读取的周期数：同比时向前多读comparison_lag个周期，使最近n_periods个周期都有去年同期"""
+    return n_periods + comparison_lag(freq, compare) if compare == 'yoy' else n_periods
+
+
+def check_comparable(cube, freq='M', compare='mom'):
+    """立方体中没有任何一对(本期, 对比期)时抛出ValueError，避免输出空的结果表"""
+    periods = np.unique(cube['YearMonth'])
+    if not np.isin(periods - comparison_lag(freq, compare), periods).any():
+        raise ValueError(f"窗口内的{len(periods)}个周期中没有可做{COMPARE_LABELS[compare]}对比的周期，请扩大分析窗口")
+
+
+def period_matrix(frame, index, value):
+    """将汇总数据透视为（index取值 × 周期）矩阵，列为窗口内连续的周期键，缺失的周期补0"""
+    pivot = (frame.groupby(index + ['YearMonth'], observed=True)[value].sum()
+             .unstack('YearMonth', fill_value=0))
+    periods = np.arange(pivot.columns.min(), pivot.columns.max() + 1)
+    return pivot.reindex(columns=periods, fill_value=0)
+
+
+# 立方体中的度量列
+CUBE_MEASURES = ['Sales', 'Customers', 'Open', 'Days']
+
+
+# 并行汇总时可用的分区方式：按店铺区间或按月份（见out_of_core.py）
+PARTITION_MODES = ['store', 'period']
+
+
+def build_cube(data, dims=CUBE_DIMS):
+    """按 周期 × dims 的最细粒度一次性汇总销售额、客流量、开门天数和记录天数
+
+    立方体的行数只取决于维度取值组合数，各维度的边际汇总都可以从它再聚合得到，
+    不必对原始数据重复分组。store.csv中没有的店铺属性为缺失值，这些行保留为单独的组，计入总额。
+    """
+    with profiling.stage('groupby_cube', rows_in=len(data)) as record:
+        cube = data.groupby(['YearMonth'] + dims, observed=True, dropna=False).agg(
+            Sales=('Sales', 'sum'),
+            Customers=('Customers', 'sum'),
+            Open=('Open', 'sum'),
+            Days=('Sales', 'size'),
+        ).reset_index()
+        record['rows_out'] = len(cube)
+    return cube
+
+
+def merge_cubes(partials, dims=CUBE_DIMS):
+    """合并部分立方体：相同键的度量直接相加
+
+    度量均为整数和或计数，合并结果与对全部数据一次汇总完全一致。
+    """
+    keys = ['YearMonth'] + dims
+    return (pd.concat(partials, ignore_index=True)
+            .groupby(keys, observed=True, dropna=False)[CUBE_MEASURES].sum().reset_index())
+
+
+def segment_periods(index, by):
+    """(分段, 周期)索引中每个分段从最早到最晚的连续周期，返回同名的MultiIndex"""
+    bounds = index.to_frame(index=False).groupby(by, observed=True, sort=True)['YearMonth'].agg(['min', 'max'])
+    lengths = (bounds['max'] - bounds['min'] + 1).to_numpy()
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return pd.MultiIndex.from_arrays([bounds.index.repeat(lengths),
+                                      np.repeat(bounds['min'].to_numpy(), lengths) + offsets],
+                                     names=[by, 'YearMonth'])
+
+
+def summarize_periods(cube, lag=1, by=None):
+    """按周期汇总销售额、客流量和开门天数，并计算与对比期（lag个周期之前）的变化
+
+    by为分段列（如StoreType、Store）时一次汇总所有分段：第一列为分段列，每个分段的周期各自连续，
+    并与本分段的对比期比较，结果与对每个分段单独汇总相同。
+    """
+    keys = ['YearMonth'] if by is None else [by, 'YearMonth']
+    period_sales = cube.groupby(keys, observed=True).agg({
+        'Sales': 'sum',
+        'Customers': 'sum',
+        'Open': 'sum'  # 开门天数总和
+    })
+    if by is None:
+        periods = np.arange(period_sales.index.min(), period_sales.index.max() + 1)
+        period_sales = period_sales.reindex(periods, fill_value=0).rename_axis('YearMonth').reset_index()
+    else:
+        period_sales = period_sales.reindex(segment_periods(period_sales.index, by), fill_value=0).reset_index()
+
+    def change(col, pct=False):
+        values = period_sales[col] if by is None else period_sales.groupby(by, observed=True, sort=False)[col]
+        return values.pct_change(lag) * 100 if pct else values.diff(lag)
+
+    # 计算与对比期的变化（列名沿用MoM以兼容下游）
+    period_sales['Sales_MoM_Change'] = change('Sales')
+    period_sales['Sales_MoM_Change_Pct'] = change('Sales', pct=True)
+    period_sales['Customers_MoM_Change'] = change('Customers')
+    period_sales['Customers_MoM_Change_Pct'] = change('Customers', pct=True)
+
+    # 计算平均客单价
+    period_sales['AvgTicket'] = period_sales['Sales'] / period_sales['Customers']
+    period_sales['AvgTicket_MoM_Change'] = change('AvgTicket')
+    period_sales['AvgTicket_MoM_Change_Pct'] = change('AvgTicket', pct=True)
+    return period_sales
+
+
+def customer_ticket_contribution(period_sales, lag=1, by=None):
+    """客流量与客单价贡献度分析，一次性计算所有(本期, 对比期)对
+
+    by为分段列时period_sales应为summarize_periods(..., by=by)的结果，只在同一分段内配对，第一列为分段列。
+    """
+    periods = period_sales['YearMonth'].to_numpy()
+    sales = period_sales['Sales'].to_numpy()
+    customers = period_sales['Customers'].to_numpy()
+    avg_ticket = period_sales['AvgTicket'].to_numpy()
+    if by is None:
+        cur = np.arange(lag, len(period_sales))
+    else:
+        cur = np.flatnonzero(period_sales.groupby(by, observed=True, sort=False).cumcount().to_numpy() >= lag)
+    prev = cur - lag
+
     # 销售额变化
-    sales_change = current_sales - prev_sales
-    
-    # 客流量变化的贡献
-    customer_contribution = (current_customers - prev_customers) * prev_avg_ticket
-    
-    # 客单价变化的贡献
-    avg_ticket_contribution = (current_avg_ticket - prev_avg_ticket) * current_customers
-    
-    # 交叉项贡献（客流变化 * 客单价变化）
-    cross_contribution = (current_customers - prev_customers) * (current_avg_ticket - prev_avg_ticket)
-    
-    # 计算贡献度占比
-    customer_contrib_pct = (customer_contribution / sales_change) * 100 if sales_change != 0 else 0
-    avg_ticket_contrib_pct = (avg_ticket_contribution / sales_change) * 100 if sales_change != 0 else 0
-    cross_contrib_pct = (cross_contribution / sales_change) * 100 if sales_change != 0 else 0
-    
-    print(f"\n{current_month}相比{prev_month}的环比分析:")
-    print(f"销售额变化: {sales_change:.2f} ({(sales_change/prev_sales)*100:.2f}%)")
-    print(f"客流量贡献: {customer_contribution:.2f} (占比: {customer_contrib_pct:.2f}%)")
-    print(f"客单价贡献: {avg_ticket_contribution:.2f} (占比: {avg_ticket_contrib_pct:.2f}%)")
-    print(f"交叉项贡献: {cross_contribution:.2f} (占比: {cross_contrib_pct:.2f}%)")
-    
-    # 保存结果
-    contribution_results.append({
-        'Current_Month': current_month,
-        'Prev_Month': prev_month,
+    sales_change = sales[cur] - sales[prev]
+    customer_change = customers[cur] - customers[prev]
+    ticket_change = avg_ticket[cur] - avg_ticket[prev]
+
+    # 客流量变化的贡献、客单价变化的贡献、交叉项贡献（客流变化 * 客单价变化）
+    customer_contribution = customer_change * avg_ticket[prev]
+    avg_ticket_contribution = ticket_change * customers[cur]
+    cross_contribution = customer_change * ticket_change
+
+    def share(values, base):
+        return np.divide(values, base, out=np.zeros(len(values)), where=base != 0) * 100
+
+    result = pd.DataFrame({
+        'Current_Month': periods[cur],
+        'Prev_Month': periods[prev],
         'Sales_Change': sales_change,
-        'Sales_Change_Pct': (sales_change/prev_sales)*100,
+        'Sales_Change_Pct': share(sales_change, sales[prev]),
         'Customer_Contribution': customer_contribution,
-        'Customer_Contrib_Pct': customer_contrib_pct,
+        'Customer_Contrib_Pct': share(customer_contribution, sales_change),
         'AvgTicket_Contribution': avg_ticket_contribution,
-        'AvgTicket_Contrib_Pct': avg_ticket_contrib_pct,
+        'AvgTicket_Contrib_Pct': share(avg_ticket_contribution, sales_change),
         'Cross_Contribution': cross_contribution,
-        'Cross_Contrib_Pct': cross_contrib_pct
+        'Cross_Contrib_Pct': share(cross_contribution, sales_change),
+    })
+    if by is not None:
+        result.insert(0, by, period_sales[by].to_numpy()[cur])
+    return result
+
+
+def fold_into_cube(cube, delta):
+    """将新增数据的立方体合并进已有立方体，只对受影响的周期重新汇总"""
+    keys = ['YearMonth'] + CUBE_DIMS
+    affected = cube['YearMonth'].isin(delta['YearMonth'].unique())
+    merged = merge_cubes([cube[affected], delta])
+    return pd.concat([cube[~affected], merged], ignore_index=True).sort_values(keys, ignore_index=True)
+
+
+def incremental_periods(all_periods, affected, lag=1):
+    """增量更新时需要刷新的周期及计算它们所需的周期
+
+    刷新的周期为新数据所在的周期，以及以它们为对比期的周期；
+    计算时还需要这些周期各自的对比期。
+    """
+    refresh = np.intersect1d(np.union1d(affected, affected + lag), all_periods)
+    needed = np.union1d(refresh, refresh - lag)
+    return refresh, needed
+
+
+def dimension_contribution(data, dims, total_change, lag=1):
+    """计算维度取值对总体销售额变化的贡献度
+
+    对dims + YearMonth做一次分组汇总并透视为（维度取值 × 周期）矩阵，
+    通过相隔lag列相减和除以总体变动额一次性得到所有取值、所有(本期, 对比期)对的结果。
+    total_change为以周期键为索引的总体变动额。
+    """
+    pivot = period_matrix(data, dims, 'Sales')
+    months = pivot.columns.to_numpy()
+    sales = pivot.to_numpy()
+
+    change = sales[:, lag:] - sales[:, :-lag]
+    total = total_change.reindex(months[lag:]).to_numpy(dtype=float)
+    contribution_pct = np.divide(change, total, out=np.zeros(change.shape),
+                                 where=total != 0) * 100
+
+    n_values, n_pairs = change.shape
+    result = pivot.index.to_frame(index=False).iloc[np.repeat(np.arange(n_values), n_pairs)]
+    result = result.reset_index(drop=True)
+    result['Current_Month'] = np.tile(months[lag:], n_values)
+    result['Prev_Month'] = np.tile(months[:-lag], n_values)
+    result['Sales_Change'] = change.ravel()
+    result['Total_Sales_Change'] = np.tile(total, n_values)
+    result['Contribution_Pct'] = contribution_pct.ravel()
+    return result
+
+
+def label_dimension(dim_results, dims, labels):
+    """为维度贡献度表的取值添加中文标签列（紧跟在维度列之后），labels为None时不添加"""
+    if labels is not None:
+        label_col, mapping = labels
+        dim_results.insert(len(dims), label_col, dim_results[dims[-1]].map(mapping))
+    return dim_results
+
+
+# 店铺级归因中每个周期对输出的正向/负向贡献店铺数
+TOP_K_STORES = 10
+
+
+def store_attribution(cube, total_change, lag=1):
+    """店铺级归因：对所有店铺、所有(本期, 对比期)对做客流/客单价分解
+
+    将立方体透视为（店铺 × 周期）的销售额和客流量矩阵，以数组运算得到每家店铺的
+    销售额变动、客流效应（客流变动 × 对比期客单价）和客单价效应（客单价变动 × 本期客流），
+    两项效应之和恰好等于该店铺的销售额变动。
+    """
+    sales = period_matrix(cube, ['Store'], 'Sales')
+    customers = period_matrix(cube, ['Store'], 'Customers').reindex_like(sales)
+    stores = sales.index.to_numpy()
+    months = sales.columns.to_numpy()
+    sales = sales.to_numpy()
+    customers = customers.to_numpy()
+
+    avg_ticket = np.divide(sales, customers, out=np.zeros(sales.shape), where=customers != 0)
+    cur, prev = slice(lag, None), slice(None, -lag)
+    sales_change = sales[:, cur] - sales[:, prev]
+    customer_effect = (customers[:, cur] - customers[:, prev]) * avg_ticket[:, prev]
+    ticket_effect = (avg_ticket[:, cur] - avg_ticket[:, prev]) * customers[:, cur]
+
+    total = total_change.reindex(months[cur]).to_numpy(dtype=float)
+    contribution_pct = np.divide(sales_change, total, out=np.zeros(sales_change.shape),
+                                 where=total != 0) * 100
+
+    n_stores, n_pairs = sales_change.shape
+    store_types = cube.groupby('Store', observed=True)['StoreType'].first()
+    result = pd.DataFrame({
+        'Store': np.repeat(stores, n_pairs),
+        'StoreType': np.repeat(store_types.reindex(stores).to_numpy(), n_pairs),
+        'Current_Month': np.tile(months[cur], n_stores),
+        'Prev_Month': np.tile(months[prev], n_stores),
+        'Sales_Change': sales_change.ravel(),
+        'Customer_Effect': customer_effect.ravel(),
+        'AvgTicket_Effect': ticket_effect.ravel(),
+        'Total_Sales_Change': np.tile(total, n_stores),
+        'Contribution_Pct': contribution_pct.ravel(),
     })
+    return result
+
+
+def top_store_contributors(store_results, k=TOP_K_STORES):
+    """取每个周期对中正向和负向贡献最大的k家店铺"""
+    ranked = store_results.sort_values(['Current_Month', 'Sales_Change'],
+                                       ascending=[True, False], kind='stable')
+    by_month = ranked.groupby('Current_Month', sort=False)
+
+    positive = by_month.head(k)
+    positive = positive[positive['Sales_Change'] > 0].assign(Direction='正向')
+    negative = by_month.tail(k).iloc[::-1]
+    negative = negative[negative['Sales_Change'] < 0].assign(Direction='负向')
+
+    top = pd.concat([positive, negative])
+    top['Rank'] = top.groupby(['Current_Month', 'Direction'], sort=False).cumcount() + 1
+    return top.sort_values(['Current_Month', 'Direction', 'Rank'], kind='stable').reset_index(drop=True)
+
+
+# 多因素Shapley分解的因素：(列名前缀, 中文名称)
+# 销售额 = 开门天数 × 店铺类型结构 × 促销结构 × 假期结构 × 店铺结构 × 日均客流 × 客单价
+SHAPLEY_FACTORS = [
+    ('OpenDays', '开门天数'),
+    ('StoreType_Mix', '店铺类型结构'),
+    ('Promo_Mix', '促销结构'),
+    ('Holiday_Mix', '假期结构'),
+    ('Store_Mix', '店铺结构'),
+    ('Traffic', '日均客流'),
+    ('Ticket', '客单价'),
+]
+
+# Shapley分解时每批处理的单元格数，用于控制 2^k × 单元格 × 周期对 中间数组的内存
+SHAPLEY_CELL_BLOCK = 2048
+
+
+def _ratio(numerator, denominator):
+    """逐元素相除，分母为0处取0"""
+    return np.divide(numerator, denominator, out=np.zeros(np.shape(numerator)), where=denominator != 0)
+
+
+def shapley_decomposition(prev, cur, block=SHAPLEY_CELL_BLOCK):
+    """乘法模型 Σ_单元格 Π_f x_f 的精确Shapley分解
+
+    prev、cur为形状(k, 单元格, 周期对)的因素取值，返回形状(k, 周期对)的各因素贡献，
+    各因素贡献之和恰好等于模型在两期之间的变化，没有交叉项残差。
+    全部2^k个因素子集的联盟取值通过广播一次算出，单元格按block分批以控制内存。
+    """
+    k, n_cells, n_pairs = prev.shape
+    subsets = np.arange(2 ** k)
+    members = (subsets[:, None] >> np.arange(k)) & 1 == 1
+
+    # 联盟取值：子集中的因素取本期值，其余取对比期值
+    values = np.zeros((2 ** k, n_pairs))
+    for lo in range(0, n_cells, block):
+        prev_block, cur_block = prev[:, lo:lo + block], cur[:, lo:lo + block]
+        product = np.ones((2 ** k,) + prev_block.shape[1:])
+        for f in range(k):
+            product *= np.where(members[:, f, None, None], cur_block[f], prev_block[f])
+        values += product.sum(axis=1)
+
+    # φ_f = Σ_{S∌f} |S|!(k-|S|-1)!/k! · (v(S∪{f}) - v(S))
+    factorials = np.array([math.factorial(n) for n in range(k + 1)], dtype=float)
+    sizes = members.sum(axis=1)
+    effects = np.empty((k, n_pairs))
+    for f in range(k):
+        without = subsets[~members[:, f]]
+        weights = factorials[sizes[without]] * factorials[k - sizes[without] - 1] / factorials[k]
+        effects[f] = weights @ (values[without | (1 << f)] - values[without])
+    return effects
+
+
+def shapley_attribution(cube, lag=1):
+    """将销售额变化精确分解到开门天数、各层结构占比、日均客流和客单价
+
+    单元格为 店铺类型 × 促销 × 学校假期 × 店铺，结构占比逐层嵌套，
+    各因素相乘恰好还原每个单元格的销售额，因此各因素贡献之和等于销售额变化。
+    """
+    cells = ['StoreType', 'Promo', 'SchoolHoliday', 'Store']
+    open_days = period_matrix(cube, cells, 'Open')
+    customers = period_matrix(cube, cells, 'Customers').reindex_like(open_days).to_numpy(dtype=float)
+    sales = period_matrix(cube, cells, 'Sales').reindex_like(open_days).to_numpy(dtype=float)
+    months = open_days.columns.to_numpy()
+
+    # 各层级的开门天数合计（广播回单元格）
+    level_open = [open_days.groupby(level=cells[:depth]).transform('sum').to_numpy(dtype=float)
+                  for depth in (1, 2, 3)]
+    cell_open = open_days.to_numpy(dtype=float)
+    total_open = np.broadcast_to(cell_open.sum(axis=0), cell_open.shape)
+
+    factors = np.stack([
+        total_open,
+        _ratio(level_open[0], total_open),
+        _ratio(level_open[1], level_open[0]),
+        _ratio(level_open[2], level_open[1]),
+        _ratio(cell_open, level_open[2]),
+        _ratio(customers, cell_open),
+        _ratio(sales, customers),
+    ])
+    effects = shapley_decomposition(factors[:, :, :-lag], factors[:, :, lag:])
+
+    total_sales = sales.sum(axis=0)
+    sales_change = total_sales[lag:] - total_sales[:-lag]
+    result = pd.DataFrame({
+        'Current_Month': months[lag:],
+        'Prev_Month': months[:-lag],
+        'Sales_Change': sales_change,
+    })
+    for (name, _), effect in zip(SHAPLEY_FACTORS, effects):
+        result[f'{name}_Effect'] = effect
+        result[f'{name}_Pct'] = _ratio(effect, sales_change) * 100
+    return result
+
+
+# 日历调整归因的因素：(列名前缀, 中文名称)，按乘法模型中的顺序排列
+CALENDAR_FACTORS = [
+    ('Calendar_Days', '营业日历天数'),
+    ('Open_Rate', '开门率'),
+    ('Promo_Share', '促销天数占比'),
+    ('Productivity', '单店日均销售额'),
+]
+
+
+def calendar_attribution(cube, lag=1):
+    """日历调整归因：把销售额变化分解为日历天数、开门率、促销天数占比和每个开门日的销售额
+
+    单元格为 店铺 × 促销状态，每个单元格的销售额写成
+        记录天数(店铺) × 开门率(店铺) × 促销状态占开门天数的比例 × 该状态下每个开门日的销售额，
+    相乘恰好还原销售额（闭店日销售额为0），用Shapley分解得到各因素的精确贡献。
+    前三项是周期长短、闭店和促销排期带来的日历效应，最后一项是剔除日历效应后的经营变化，
+    Adjusted_Change_Pct为其相对对比期销售额的比例（日历调整后的增长率）。
+    所有店铺、所有周期对以矩阵运算一次完成。
+    """
+    cells = ['Store', 'Promo']
+    open_days = period_matrix(cube, cells, 'Open')
+    sales = period_matrix(cube, cells, 'Sales').reindex_like(open_days).to_numpy(dtype=float)
+    store_days = (period_matrix(cube, ['Store'], 'Days')
+                  .reindex(open_days.index.get_level_values('Store')).to_numpy(dtype=float))
+    months = open_days.columns.to_numpy()
+
+    # 店铺的开门天数合计（广播回单元格）
+    cell_open = open_days.to_numpy(dtype=float)
+    store_open = open_days.groupby(level='Store').transform('sum').to_numpy(dtype=float)
+
+    factors = np.stack([
+        store_days,
+        _ratio(store_open, store_days),
+        _ratio(cell_open, store_open),
+        _ratio(sales, cell_open),
+    ])
+    effects = shapley_decomposition(factors[:, :, :-lag], factors[:, :, lag:])
+
+    total_sales = sales.sum(axis=0)
+    sales_change = total_sales[lag:] - total_sales[:-lag]
+    total_open = cell_open.sum(axis=0)
+    promo_open = cell_open[open_days.index.get_level_values('Promo') == 1].sum(axis=0)
+    result = pd.DataFrame({
+        'Current_Month': months[lag:],
+        'Prev_Month': months[:-lag],
+        'Sales_Change': sales_change,
+        'Open_Days': total_open[lag:],
+        'Prev_Open_Days': total_open[:-lag],
+        'Promo_Day_Share': _ratio(promo_open, total_open)[lag:] * 100,
+        'Prev_Promo_Day_Share': _ratio(promo_open, total_open)[:-lag] * 100,
+    })
+    for (name, _), effect in zip(CALENDAR_FACTORS, effects):
+        result[f'{name}_Effect'] = effect
+        result[f'{name}_Pct'] = _ratio(effect, sales_change) * 100
+    result['Adjusted_Change_Pct'] = _ratio(effects[-1], total_sales[:-lag]) * 100
+    return result
+
+# 各输出表（写入output/<名称>.csv）的排序列，增量更新合并文件时使用
+OUTPUT_SORT_COLUMNS = {
+    'monthly_sales': ['YearMonth'],
+    'contribution_analysis': ['Current_Month'],
+    **{name: dims + ['Current_Month'] for dims, _, name, _ in DIMENSION_ANALYSES},
+    'store_contribution': ['Store', 'Current_Month'],
+    'store_top_contributors': ['Current_Month', 'Direction', 'Rank'],
+    'shapley_decomposition': ['Current_Month'],
+    'calendar_attribution': ['Current_Month'],
+}
+
+
+def build_sales_cache(train_path='train.csv', store_path='store.csv', sources=None, params=None,
+                      chunksize=CHUNK_SIZE):
+    """分块读取全部历史，预处理后按月写入列式缓存，返回缓存的manifest
+
+    每块解析日期、计算月份键并附加店铺属性后按月份分区写出，峰值内存只取决于chunksize和写出缓冲。
+    """
+    store_data = read_store_data(store_path)
+    info = {'first_date': None, 'last_date': None, 'rows': 0}
+
+    def chunks():
+        for chunk in pd.read_csv(train_path, dtype=TRAIN_DTYPES, chunksize=chunksize):
+            info['rows'] += len(chunk)
+            chunk_min, chunk_max = chunk['Date'].min(), chunk['Date'].max()
+            info['first_date'] = chunk_min if info['first_date'] is None else min(info['first_date'], chunk_min)
+            info['last_date'] = chunk_max if info['last_date'] is None else max(info['last_date'], chunk_max)
+            yield preprocess(chunk, store_data, 'M')
+
+    with profiling.stage('save_cache') as record:
+        manifest = save_cache(chunks(), sources, params, partition_col='YearMonth', info=info)
+        record['rows_in'] = info['rows']
+    if info['rows'] == 0:
+        raise ValueError(f"{train_path} 中没有数据")
+    return manifest
+
+
+def month_key(date):
+    """ISO日期字符串所在月份的整数键（与period_key(..., 'M')一致）"""
+    return int(date[:4]) * 12 + int(date[5:7]) - 1
+
+
+def load_data(freq='M', n_periods=N_PERIODS, start=None, end=None,
+              train_path='train.csv', store_path='store.csv', use_cache=True):
+    """读取并预处理分析窗口内的销售数据
+
+    use_cache为True时，全部历史只预处理一次，按月写入列式缓存（cache/sales，train.csv或store.csv
+    变化时自动重建）；之后任何窗口和周期粒度都只读取与窗口重叠的月份分区。
+    """
+    if not use_cache:
+        print("正在读取数据...")
+        window_start, window_end = resolve_window(train_path, freq, n_periods, start, end)
+        train_data = read_train_data(train_path, window_start, window_end)
+        if len(train_data) == 0:
+            raise ValueError(f"窗口 {window_start} ~ {window_end or '最新'} 内没有数据")
+        store_data = read_store_data(store_path)
+
+        print("正在处理数据...")
+        return preprocess(train_data, store_data, freq)
+
+    cache_sources = {'train': train_path, 'store': store_path}
+    cache_params = {'attributes': STORE_ATTRIBUTES}
+    with profiling.stage('load_cache'):
+        manifest = load_cache(cache_sources, cache_params)
+    if manifest is None:
+        print("正在预处理全部历史数据并按月写入缓存...")
+        manifest = build_sales_cache(train_path, store_path, cache_sources, cache_params)
+    else:
+        print("已从缓存读取预处理数据")
+
+    window_start, window_end = resolve_window(train_path, freq, n_periods, start, end,
+                                              max_date=manifest['info']['last_date'])
+    first = month_key(window_start)
+    last = None if window_end is None else month_key(window_end)
+    partitions = [key for key in manifest['partitions'] if int(key) >= first and (last is None or int(key) <= last)]
+    with profiling.stage('read_cache') as record:
+        data = read_cache(manifest, partitions)
+        if data is None and partitions:
+            # 分区文件缺失或损坏：重建缓存后再读一次
+            manifest = build_sales_cache(train_path, store_path, cache_sources, cache_params)
+            data = read_cache(manifest, partitions)
+        if data is not None:
+            mask = data['Date'] >= window_start
+            if window_end is not None:
+                mask &= data['Date'] <= window_end
+            data = data[mask.to_numpy()].reset_index(drop=True)
+        record['rows_out'] = 0 if data is None else len(data)
+    if data is None or len(data) == 0:
+        raise ValueError(f"窗口 {window_start} ~ {window_end or '最新'} 内没有数据")
+
+    # 缓存中的周期键按月计算，其他粒度按日期重新计算
+    if freq != 'M':
+        data['YearMonth'] = period_key(data['Date'], freq)
+    return data
+
+
+def attribute(cube, freq='M', compare='mom'):
+    """对聚合立方体做全部归因分析，返回{输出名称: 结果表}，周期列为整数键
+
+    窗口内没有可对比的周期时抛出ValueError。
+    """
+    check_comparable(cube, freq, compare)
+    lag = comparison_lag(freq, compare)
+
+    rows = len(cube)
+    results = {}
+
+    def traced(name, func, *args):
+        with profiling.stage(name, rows_in=rows) as record:
+            results[name] = func(*args)
+            record['rows_out'] = len(results[name])
+        return results[name]
+
+    # 各周期汇总及与对比期的变化
+    traced('monthly_sales', summarize_periods, cube, lag)
+
+    # 客流与客单价贡献度
+    traced('contribution_analysis', customer_ticket_contribution, results['monthly_sales'], lag)
+
+    # 各维度贡献度（总体变动额以周期键为索引）
+    total_sales_change = results['monthly_sales'].set_index('YearMonth')['Sales_MoM_Change']
+    for dims, _, name, labels in DIMENSION_ANALYSES:
+        label_dimension(traced(name, dimension_contribution, cube, dims, total_sales_change, lag), dims, labels)
+
+    # 店铺级归因及每个周期正负向前K名店铺
+    traced('store_contribution', store_attribution, cube, total_sales_change, lag)
+    traced('store_top_contributors', top_store_contributors, results['store_contribution'])
+
+    # 多因素Shapley分解
+    traced('shapley_decomposition', shapley_attribution, cube, lag)
+
+    # 日历调整归因（天数、开门率、促销天数占比、每个开门日的销售额）
+    traced('calendar_attribution', calendar_attribution, cube, lag)
+    return results
+
+
+def print_results(results, compare='mom'):
+    """在控制台打印分析结果（结果表应已加上周期标签）"""
+    compare_label = COMPARE_LABELS[compare]
+
+    print(f"\n各周期总体销售情况及{compare_label}变化:")
+    print(results['monthly_sales'][['YearMonth', 'Sales', 'Sales_MoM_Change', 'Sales_MoM_Change_Pct',
+                                    'Customers', 'AvgTicket']])
+
+    print("\n正在分析客流量与客单价贡献度...")
+    for row in results['contribution_analysis'].itertuples(index=False):
+        print(f"\n{row.Current_Month}相比{row.Prev_Month}的{compare_label}分析:")
+        print(f"销售额变化: {row.Sales_Change:.2f} ({row.Sales_Change_Pct:.2f}%)")
+        print(f"客流量贡献: {row.Customer_Contribution:.2f} (占比: {row.Customer_Contrib_Pct:.2f}%)")
+        print(f"客单价贡献: {row.AvgTicket_Contribution:.2f} (占比: {row.AvgTicket_Contrib_Pct:.2f}%)")
+        print(f"交叉项贡献: {row.Cross_Contribution:.2f} (占比: {row.Cross_Contrib_Pct:.2f}%)")
+
+    for _, title, name, _ in DIMENSION_ANALYSES:
+        print(f"\n正在分析{title}维度...")
+        print(results[name].to_string(index=False))
+
+    print("\n正在分析店铺级贡献度...")
+    for _, period_top in results['store_top_contributors'].groupby('Current_Month', sort=False):
+        print(f"\n{period_top['Current_Month'].iloc[0]}相比{period_top['Prev_Month'].iloc[0]}, 贡献最大的店铺:")
+        print(period_top[['Direction', 'Rank', 'Store', 'StoreType', 'Sales_Change',
+                          'Customer_Effect', 'AvgTicket_Effect', 'Contribution_Pct']].to_string(index=False))
+
+    if 'dimension_contribution' in results:
+        print("\n自定义维度贡献度:")
+        print(results['dimension_contribution'].to_string(index=False))
+
+    print("\n多因素Shapley分解（各因素贡献之和等于销售额变化）:")
+    for row in results['shapley_decomposition'].to_dict('records'):
+        print(f"\n{row['Current_Month']}相比{row['Prev_Month']}, 销售额变化: {row['Sales_Change']:.2f}")
+        for name, title in SHAPLEY_FACTORS:
+            print(f"{title}贡献: {row[f'{name}_Effect']:.2f} (占比: {row[f'{name}_Pct']:.2f}%)")
+
+    print("\n日历调整归因（剔除天数、闭店和促销排期的影响）:")
+    for row in results['calendar_attribution'].to_dict('records'):
+        print(f"\n{row['Current_Month']}相比{row['Prev_Month']}, 销售额变化: {row['Sales_Change']:.2f}, "
+              f"开门天数: {row['Prev_Open_Days']:.0f} -> {row['Open_Days']:.0f}, "
+              f"促销天数占比: {row['Prev_Promo_Day_Share']:.2f}% -> {row['Promo_Day_Share']:.2f}%")
+        for name, title in CALENDAR_FACTORS:
+            print(f"{title}贡献: {row[f'{name}_Effect']:.2f} (占比: {row[f'{name}_Pct']:.2f}%)")
+        print(f"日历调整后的增长率: {row['Adjusted_Change_Pct']:.2f}%")
+
+
+def write_output(df, path, key_col, sort_cols, refresh_labels=None):
+    """将已加上周期标签的结果表写入CSV，返回写入的完整表
+
+    refresh_labels为增量更新时刷新的周期标签，此时只替换文件中key_col属于这些周期的行，其余行保持不变。
+    """
+    if refresh_labels is not None and os.path.exists(path):
+        label_cols = ['YearMonth', 'Current_Month', 'Prev_Month']
+        existing = pd.read_csv(path, dtype={col: str for col in label_cols}, float_precision='round_trip')
+        existing = existing[~existing[key_col].isin(refresh_labels)]
+        df = pd.concat([existing, df], ignore_index=True)
+        df = df.sort_values(sort_cols, kind='stable', ignore_index=True)
+    df.to_csv(path, index=False)
+    return df
+
+
+def report(results, freq='M', compare='mom', output_dir='output', refresh=None, verbose=True):
+    """为结果表加上周期标签、打印并写入output_dir，返回写入的结果表
+
+    refresh为增量更新时刷新的周期键，此时只写入这些周期的行并与已有文件合并。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    labeled = {}
+    for name, df in results.items():
+        key_col = 'YearMonth' if name == 'monthly_sales' else 'Current_Month'
+        if refresh is not None:
+            df = df[df[key_col].isin(refresh)]
+        labeled[name] = with_period_labels(df, freq)
+
+    if verbose:
+        print_results(labeled, compare)
+
+    refresh_labels = None if refresh is None else [format_period(p, freq) for p in refresh]
+    written = {}
+    for name, df in labeled.items():
+        key_col = 'YearMonth' if name == 'monthly_sales' else 'Current_Month'
+        path = os.path.join(output_dir, f'{name}.csv')
+        sort_cols = OUTPUT_SORT_COLUMNS.get(name, ['Current_Month'])
+        with profiling.stage(f'write_{name}', rows_in=len(df)) as record:
+            written[name] = write_output(df, path, key_col, sort_cols, refresh_labels)
+            record['rows_out'] = len(written[name])
+    return written
+
+
+def run(freq='M', compare='mom', n_periods=N_PERIODS, start=None, end=None,
+        train_path='train.csv', store_path='store.csv', output_dir='output', verbose=True,
+        workers=1, partition_by='store', daily=False, out_of_core=False):
+    """完整分析流程：读取 → 聚合 → 归因 → 输出，返回写入output_dir的结果表
+
+    未指定start时分析最近n_periods个周期，同比时窗口向前多读一年作为对比期（见window_periods()）；
+    窗口内没有可对比的周期时抛出ValueError，不写出任何结果。
+    workers大于1时基于按月分区的文件（out_of_core.py，首次使用时构建）并行汇总：按partition_by
+    （store或period）把店铺区间或月份分给各进程，每个进程自己读取、预处理并汇总，只返回部分立方体。
+    daily为True时从店铺 × 日期的每日数组（daily_cube.py，首次使用时构建）直接汇总出立方体，不读取原始行。
+    out_of_core为True时从按月分区的文件（out_of_core.py，首次使用时构建）逐个汇总部分立方体再合并，
+    不把窗口内的全部行同时读入内存。
+    """
+    n_periods = window_periods(n_periods, freq, compare)
+    if out_of_core or workers > 1:
+        import out_of_core as ooc
+
+        cube, max_date = ooc.load_period_cube(freq, n_periods, start, end, [train_path], store_path,
+                                              workers=workers, partition_by=partition_by)
+    elif daily:
+        import daily_cube
+
+        with profiling.stage('daily_period_cube') as record:
+            cube, max_date = daily_cube.load_period_cube(freq, n_periods, start, end, train_path, store_path)
+            record['rows_out'] = len(cube)
+    else:
+        data = load_data(freq, n_periods, start, end, train_path, store_path)
+        max_date = data['Date'].max().strftime('%Y-%m-%d')
+
+        # 对窗口数据只扫描一次，后续各项汇总都从聚合立方体得到
+        cube = build_cube(data)
+    periods = np.sort(cube['YearMonth'].unique())
+    print(f"分析的周期: {[format_period(p, freq) for p in periods]}")
+    results = attribute(cube, freq, compare)
+
+    # 保存聚合状态，供之后的增量更新使用
+    with profiling.stage('save_state', rows_in=len(cube)):
+        save_state(cube, {'freq': freq, 'compare': compare, 'max_date': max_date})
+    return report(results, freq, compare, output_dir, verbose=verbose)
+
+
+def run_update(new_path, store_path='store.csv', output_dir='output', verbose=True):
+    """增量更新：将new_path中的新增日期折叠进上次运行保存的聚合状态，只刷新受影响的周期
+
+    周期粒度和对比方式沿用上次运行。没有可用状态时抛出RuntimeError，没有新增数据时返回None。
+    """
+    with profiling.stage('load_state'):
+        cube, state = load_state()
+    if cube is None:
+        raise RuntimeError("未找到增量聚合状态，请先完整运行一次 sales_analysis.py")
+    if list(cube.columns) != ['YearMonth'] + CUBE_DIMS + CUBE_MEASURES:
+        raise RuntimeError("增量聚合状态的维度与当前的分析维度不一致，请先完整运行一次 sales_analysis.py")
+    freq, compare = state['freq'], state['compare']
+    lag = comparison_lag(freq, compare)
+
+    print(f"正在读取新增数据 {new_path}（已处理至 {state['max_date']}）...")
+    next_day = (pd.Timestamp(state['max_date']) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    new_data = read_train_data(new_path, start=next_day)
+    if len(new_data) == 0:
+        print("没有新增日期的数据，无需更新")
+        return None
+
+    new_data = preprocess(new_data, read_store_data(store_path), freq)
+    affected = np.unique(new_data['YearMonth'])
+    delta = build_cube(new_data)
+    with profiling.stage('fold_into_cube', rows_in=len(delta)) as record:
+        cube = fold_into_cube(cube, delta)
+        record['rows_out'] = len(cube)
+    state['max_date'] = new_data['Date'].max().strftime('%Y-%m-%d')
+    with profiling.stage('save_state', rows_in=len(cube)):
+        save_state(cube, state)
+
+    # 只对受影响的周期及其对比期重新计算
+    refresh, needed = incremental_periods(np.unique(cube['YearMonth']), affected, lag)
+    print(f"新增{len(new_data)}行，刷新的周期: {[format_period(p, freq) for p in refresh]}")
+    results = attribute(cube[cube['YearMonth'].isin(needed)], freq, compare)
+    return report(results, freq, compare, output_dir, refresh=refresh, verbose=verbose)
+
+
+# 归因查询的结果缓存，首次查询时创建
+_result_cache = None
+
+
+def result_cache():
+    """返回进程内共享的归因查询结果缓存"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
+
+
+def normalize_filters(filters):
+    """将筛选条件规范为按列名排序的{列名: 排序后的取值列表}，使等价的筛选条件得到相同的缓存键"""
+    normalized = {}
+    for col, values in (filters or {}).items():
+        if np.isscalar(values):
+            values = [values]
+        values = {value.item() if isinstance(value, np.generic) else value for value in values}
+        normalized[col] = sorted(values, key=str)
+    return dict(sorted(normalized.items()))
+
+
+def apply_filters(data, filters, store_path='store.csv'):
+    """按筛选条件保留行
+
+    数据中已有的列（如Promo、StoreType）直接按行筛选，其余列视为store.csv中的店铺属性
+    （如Promo2、Assortment），先筛出符合条件的店铺再保留这些店铺的行。
+    """
+    mask = np.ones(len(data), dtype=bool)
+    store_filters = {}
+    for col, values in filters.items():
+        if col in data.columns:
+            mask &= data[col].isin(values).to_numpy()
+        else:
+            store_filters[col] = values
+
+    if store_filters:
+        stores = read_store_data(store_path, list(store_filters))
+        keep = np.ones(len(stores), dtype=bool)
+        for col, values in store_filters.items():
+            keep &= stores[col].isin(values).to_numpy()
+        mask &= data['Store'].isin(stores.loc[keep, 'Store']).to_numpy()
+    return data[mask]
+
+
+def query_attribution(freq='M', compare='mom', n_periods=N_PERIODS, start=None, end=None,
+                      dims=None, filters=None, train_path='train.csv', store_path='store.csv', cache=None):
+    """带结果缓存的归因查询，返回{输出名称: 结果表}，周期列为整数键
+
+    filters为{列名: 取值或取值列表}，只对筛选后的数据做归因；dims为额外的维度列表，
+    结果中会多一张按这些维度的贡献度表dimension_contribution。
+    缓存键由窗口、维度、筛选条件和源文件的数据版本决定，重复的查询直接返回缓存的结果
+    （返回的结果表与缓存共享，调用方不应原地修改）。
+    """
+    cache = result_cache() if cache is None else cache
+    dims = list(dims or [])
+    filters = normalize_filters(filters)
+    query = {'freq': freq, 'compare': compare, 'periods': n_periods, 'start': start, 'end': end,
+             'dims': dims, 'filters': filters, 'cube_dims': CUBE_DIMS}
+    key = cache.key(query, {'train': train_path, 'store': store_path})
+    results = cache.get(key)
+    if results is not None:
+        print("已从结果缓存读取归因结果")
+        return results
+
+    data = load_data(freq, window_periods(n_periods, freq, compare), start, end, train_path, store_path)
+    if filters:
+        data = apply_filters(data, filters, store_path)
+        if len(data) == 0:
+            raise ValueError(f"筛选条件 {filters} 下没有数据")
+
+    results = attribute(build_cube(data), freq, compare)
+    if dims:
+        # 额外维度中不在数据里的列从store.csv附加
+        extra = [col for col in dims if col not in data.columns]
+        if extra:
+            data = attach_store_attributes(data, read_store_data(store_path, extra), extra)
+        total_sales_change = results['monthly_sales'].set_index('YearMonth')['Sales_MoM_Change']
+        results['dimension_contribution'] = dimension_contribution(
+            data, dims, total_sales_change, comparison_lag(freq, compare))
+
+    cache.put(key, results)
+    return results
+
+
+def run_query(freq='M', compare='mom', n_periods=N_PERIODS, start=None, end=None, dims=None, filters=None,
+              output_dir=os.path.join('output', 'query'), verbose=True):
+    """对筛选后的数据做（带缓存的）归因查询，结果写入output_dir，不影响完整运行的输出和增量状态"""
+    results = query_attribution(freq, compare, n_periods, start, end, dims, filters)
+    return report(results, freq, compare, output_dir, verbose=verbose)
+
+
+def parse_filter(text):
+    """解析命令行筛选条件 COL=V1,V2，数值形式的取值转为数字"""
+    col, sep, values = text.partition('=')
+    if not sep or not col or not values:
+        raise ValueError(f"筛选条件格式应为 列名=取值1,取值2: {text}")
+
+    def convert(value):
+        for kind in (int, float):
+            try:
+                return kind(value)
+            except ValueError:
+                pass
+        return value
+
+    return col, [convert(value) for value in values.split(',')]
+
+
+def parse_args(argv=None):
+    """解析命令行参数：分析窗口、周期粒度、对比方式和增量更新"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='零售销售额环比/同比归因分析')
+    parser.add_argument('--start', help='窗口起始日期(YYYY-MM-DD)，默认按--periods从最新日期往前推')
+    parser.add_argument('--end', help='窗口结束日期(YYYY-MM-DD)，默认到数据中的最新日期')
+    parser.add_argument('--periods', type=int, default=N_PERIODS,
+                        help=f'未指定--start时分析的周期数，默认{N_PERIODS}；同比时窗口自动向前多读一年作为对比期')
+    parser.add_argument('--freq', choices=FREQ_CHOICES, default='M',
+                        help='周期粒度：W=周, M=月, Q=季度，默认M')
+    parser.add_argument('--compare', choices=list(COMPARE_LABELS), default='mom',
+                        help='对比方式：mom=环比, yoy=同比，默认mom')
+    parser.add_argument('--update', metavar='NEW_CSV',
+                        help='增量更新：将NEW_CSV中的新增日期折叠进上次运行保存的聚合状态，'
+                             '只刷新受影响的周期（周期粒度和对比方式沿用上次运行）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行汇总使用的进程数，默认1（串行）；大于1时各进程分别读取按月分区的文件'
+                             '（cache/partitions，首次使用时构建）')
+    parser.add_argument('--partition-by', choices=PARTITION_MODES, default='store',
+                        help='并行汇总的分区方式：store=按店铺区间, period=按月份，默认store')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='将各阶段的耗时、CPU时间、行数和内存峰值写入PATH（.json或.csv）并打印汇总表')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='用tracemalloc额外记录各阶段的内存分配峰值（运行会明显变慢）')
+    parser.add_argument('--profile', choices=profiling.PROFILERS,
+                        help='用cProfile或pyinstrument剖析整个运行，结果写入output/profile.prof或profile.html')
+    parser.add_argument('--daily', action='store_true',
+                        help='从店铺 × 日期的每日数组（cache/daily，首次使用或train.csv变化时构建）汇总，不读取原始行')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='从按月分区的文件（cache/partitions，首次使用或train.csv变化时构建）逐个流式汇总，'
+                             '内存只取决于单个分区和聚合立方体的大小')
+    parser.add_argument('--filter', action='append', default=[], metavar='COL=V1,V2',
+                        help='只分析满足条件的数据，可重复指定；列可以是Promo、StoreType等行级列，'
+                             '也可以是store.csv中的店铺属性（如Promo2、Assortment）。结果写入output/query')
+    parser.add_argument('--dims', help='额外输出按这些维度（逗号分隔，如Assortment,Promo）的贡献度，结果写入output/query')
+    args = parser.parse_args(argv)
+
+    # 并行汇总只用于完整运行（可与--out-of-core同用），其他模式不会用到进程池
+    if args.workers < 1:
+        parser.error("--workers 应为正整数")
+    if args.workers > 1:
+        conflicts = [flag for flag, used in [('--daily', args.daily), ('--filter', args.filter),
+                                             ('--dims', args.dims), ('--update', args.update)] if used]
+        if conflicts:
+            parser.error(f"--workers 不能与 {'、'.join(conflicts)} 同时使用")
+    return args
+
+
+def run_from_args(args):
+    """按命令行参数运行完整分析或增量更新，增量更新没有新增数据时返回None"""
+    with profiling.stage('update' if args.update else 'run'):
+        if args.update:
+            return run_update(args.update)
+        if args.filter or args.dims:
+            filters = dict(parse_filter(text) for text in args.filter)
+            dims = args.dims.split(',') if args.dims else None
+            return run_query(args.freq, args.compare, args.periods, args.start, args.end, dims, filters)
+        return run(args.freq, args.compare, args.periods, args.start, args.end,
+                   workers=args.workers, partition_by=args.partition_by, daily=args.daily,
+                   out_of_core=args.out_of_core)
+
+
+def main(argv=None):
+    """命令行入口"""
+    args = parse_args(argv)
+    profiling.reset()
+    if args.trace_memory:
+        profiling.start_memory_tracing()
+
+    try:
+        if args.profile:
+            with profiling.profiler(args.profile, profiling.profile_path(args.profile)):
+                updated = run_from_args(args)
+            print(f"剖析结果已保存到 {profiling.profile_path(args.profile)}")
+        else:
+            updated = run_from_args(args)
+    except (RuntimeError, ValueError) as e:
+        raise SystemExit(str(e))
+
+    if args.trace:
+        profiling.print_trace()
+        profiling.write_trace(args.trace)
+        print(f"阶段追踪已保存到 {args.trace}")
+    if updated is not None:
+        print("\n分析完成，结果已保存到output文件夹。")
+
 
-# 保存贡献度结果到CSV
-pd.DataFrame(contribution_results).to_csv('output/contribution_analysis.csv', index=False)
-
-# 7. 店铺类型维度分析
-print("\n正在分析店铺类型维度...")
-# 按店铺类型和月份分组
-store_type_monthly = recent_data.groupby(['StoreType', 'YearMonth']).agg({
-    'Sales': 'sum',
-    'Customers': 'sum'
-}).reset_index()
-
-store_type_results = []
-
-# 计算每种店铺类型的月度环比变化
-for store_type in store_type_monthly['StoreType'].unique():
-    st_data = store_type_monthly[store_type_monthly['StoreType'] == store_type].sort_values('YearMonth')
-    
-    st_data['Sales_MoM_Change'] = st_data['Sales'].diff()
-    st_data['Sales_MoM_Change_Pct'] = st_data['Sales'].pct_change() * 100
-    
-    print(f"\n店铺类型 {store_type} 的月度销售额及环比变化:")
-    print(st_data[['YearMonth', 'Sales', 'Sales_MoM_Change', 'Sales_MoM_Change_Pct']])
-    
-    # 计算每种店铺类型对总体销售额环比变化的贡献度
-    for i in range(1, len(st_data)):
-        current_month = st_data.iloc[i]['YearMonth']
-        prev_month = st_data.iloc[i-1]['YearMonth']
-        
-        # 该店铺类型的销售额变化
-        sales_change = st_data.iloc[i]['Sales'] - st_data.iloc[i-1]['Sales']
-        
-        # 总体销售额变化（从monthly_sales中获取）
-        total_month_data = monthly_sales[monthly_sales['YearMonth'] == current_month]
-        if len(total_month_data) > 0:
-            total_sales_change = total_month_data['Sales_MoM_Change'].values[0]
-            
-            # 计算贡献度
-            contribution_pct = (sales_change / total_sales_change) * 100 if total_sales_change != 0 else 0
-            
-            print(f"{current_month}相比{prev_month}, 店铺类型 {store_type} 的贡献度: {contribution_pct:.2f}%")
-            
-            # 保存结果
-            store_type_results.append({
-                'StoreType': store_type,
-                'Current_Month': current_month,
-                'Prev_Month': prev_month,
-                'Sales_Change': sales_change,
-                'Total_Sales_Change': total_sales_change,
-                'Contribution_Pct': contribution_pct
-            })
-
-# 保存店铺类型贡献度结果到CSV
-pd.DataFrame(store_type_results).to_csv('output/store_type_contribution.csv', index=False)
-
-# 8. 促销维度分析
-print("\n正在分析促销维度...")
-# 按促销状态和月份分组
-promo_monthly = recent_data.groupby(['Promo', 'YearMonth']).agg({
-    'Sales': 'sum',
-    'Customers': 'sum',
-    'Store': 'count'  # 统计天数
-}).rename(columns={'Store': 'Days'}).reset_index()
-
-promo_results = []
-
-# 计算有促销和无促销的月度环比变化
-for promo in [0, 1]:
-    promo_data = promo_monthly[promo_monthly['Promo'] == promo].sort_values('YearMonth')
-    
-    # 计算环比变化
-    promo_data['Sales_MoM_Change'] = promo_data['Sales'].diff()
-    promo_data['Sales_MoM_Change_Pct'] = promo_data['Sales'].pct_change() * 100
-    
-    promo_label = "有促销" if promo == 1 else "无促销"
-    print(f"\n{promo_label}时段的月度销售额及环比变化:")
-    print(promo_data[['YearMonth', 'Sales', 'Days', 'Sales_MoM_Change', 'Sales_MoM_Change_Pct']])
-    
-    # 计算促销状态对总体销售额环比变化的贡献度
-    for i in range(1, len(promo_data)):
-        current_month = promo_data.iloc[i]['YearMonth']
-        prev_month = promo_data.iloc[i-1]['YearMonth']
-        
-        # 该促销状态的销售额变化
-        sales_change = promo_data.iloc[i]['Sales'] - promo_data.iloc[i-1]['Sales']
-        
-        # 总体销售额变化
-        total_month_data = monthly_sales[monthly_sales['YearMonth'] == current_month]
-        if len(total_month_data) > 0:
-            total_sales_change = total_month_data['Sales_MoM_Change'].values[0]
-            
-            # 计算贡献度
-            contribution_pct = (sales_change / total_sales_change) * 100 if total_sales_change != 0 else 0
-            
-            print(f"{current_month}相比{prev_month}, {promo_label}的贡献度: {contribution_pct:.2f}%")
-            
-            # 保存结果
-            promo_results.append({
-                'Promo': promo,
-                'Promo_Label': promo_label,
-                'Current_Month': current_month,
-                'Prev_Month': prev_month,
-                'Sales_Change': sales_change,
-                'Total_Sales_Change': total_sales_change,
-                'Contribution_Pct': contribution_pct
-            })
-
-# 保存促销贡献度结果到CSV
-pd.DataFrame(promo_results).to_csv('output/promo_contribution.csv', index=False)
-
-# 9. 假期维度分析
-print("\n正在分析假期维度...")
-# 按学校假期状态和月份分组
-holiday_monthly = recent_data.groupby(['SchoolHoliday', 'YearMonth']).agg({
-    'Sales': 'sum',
-    'Customers': 'sum',
-    'Store': 'count'  # 统计天数
-}).rename(columns={'Store': 'Days'}).reset_index()
-
-holiday_results = []
-
-# 计算假期和非假期的月度环比变化
-for holiday in [0, 1]:
-    holiday_data = holiday_monthly[holiday_monthly['SchoolHoliday'] == holiday].sort_values('YearMonth')
-    
-    # 计算环比变化
-    holiday_data['Sales_MoM_Change'] = holiday_data['Sales'].diff()
-    holiday_data['Sales_MoM_Change_Pct'] = holiday_data['Sales'].pct_change() * 100
-    
-    holiday_label = "学校假期" if holiday == 1 else "非学校假期"
-    print(f"\n{holiday_label}的月度销售额及环比变化:")
-    print(holiday_data[['YearMonth', 'Sales', 'Days', 'Sales_MoM_Change', 'Sales_MoM_Change_Pct']])
-    
-    # 计算假期状态对总体销售额环比变化的贡献度
-    for i in range(1, len(holiday_data)):
-        current_month = holiday_data.iloc[i]['YearMonth']
-        prev_month = holiday_data.iloc[i-1]['YearMonth']
-        
-        # 该假期状态的销售额变化
-        sales_change = holiday_data.iloc[i]['Sales'] - holiday_data.iloc[i-1]['Sales']
-        
-        # 总体销售额变化
-        total_month_data = monthly_sales[monthly_sales['YearMonth'] == current_month]
-        if len(total_month_data) > 0:
-            total_sales_change = total_month_data['Sales_MoM_Change'].values[0]
-            
-            # 计算贡献度
-            contribution_pct = (sales_change / total_sales_change) * 100 if total_sales_change != 0 else 0
-            
-            print(f"{current_month}相比{prev_month}, {holiday_label}的贡献度: {contribution_pct:.2f}%")
-            
-            # 保存结果
-            holiday_results.append({
-                'SchoolHoliday': holiday,
-                'Holiday_Label': holiday_label,
-                'Current_Month': current_month,
-                'Prev_Month': prev_month,
-                'Sales_Change': sales_change,
-                'Total_Sales_Change': total_sales_change,
-                'Contribution_Pct': contribution_pct
-            })
-
-# 保存假期贡献度结果到CSV
-pd.DataFrame(holiday_results).to_csv('output/holiday_contribution.csv', index=False)
-
-print("\n分析完成，结果已保存到output文件夹。") 
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# 缓存根目录
+CACHE_DIR = 'cache'
+
+# 预处理数据缓存的目录
+SALES_CACHE_DIR = os.path.join(CACHE_DIR, 'sales')
+
+# 缓存格式版本，预处理逻辑变化时递增以使旧缓存失效
+CACHE_VERSION = 6
+
+# 写分区文件时内存中缓冲的最大行数，超过时先写出行数最多的分区
+PARTITION_BUFFER_ROWS = 1000000
+
+# 归因查询结果在内存中保留的条目数
+RESULT_CACHE_SIZE = 64
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    # 未安装pyarrow时退回到pickle，同样保留dtype（包括categorical和datetime）
+    CACHE_FORMAT = 'pickle'
+
+
+def _hash_file(path, block_size=1 << 20):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, known=None):
+    """计算文件指纹（大小、修改时间、内容哈希）
+
+    known为上次记录的指纹，若大小和修改时间都没有变化则直接沿用其哈希，不再重读文件。
+    """
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if known and known.get('size') == stat.st_size and known.get('mtime_ns') == stat.st_mtime_ns:
+        fingerprint['sha256'] = known['sha256']
+    else:
+        fingerprint['sha256'] = _hash_file(path)
+    return fingerprint
+
+
+def frame_suffix(fmt):
+    """缓存格式对应的文件扩展名"""
+    return '.parquet' if fmt == 'parquet' else '.pkl'
+
+
+def write_frame(frame, path, fmt=CACHE_FORMAT):
+    """按缓存格式写出一个DataFrame（不保留索引）"""
+    frame = frame.reset_index(drop=True)
+    if fmt == 'parquet':
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_pickle(path)
+
+
+def read_frame(path, fmt=CACHE_FORMAT):
+    """读取write_frame()写出的DataFrame"""
+    return pd.read_parquet(path) if fmt == 'parquet' else pd.read_pickle(path)
+
+
+class PartitionWriter:
+    """把逐块到来的数据按分区键缓冲，再写成分区文件（directory/<分区键>/part-<n>）
+
+    同一分区的行先在内存中累积，缓冲的总行数超过max_rows时写出行数最多的分区；
+    即使输入没有按分区键排序，文件数也只取决于数据量，而不是块数 × 分区数。
+    """
+
+    def __init__(self, directory, fmt=CACHE_FORMAT, max_rows=PARTITION_BUFFER_ROWS):
+        self.directory = directory
+        self.fmt = fmt
+        self.max_rows = max_rows
+        self.files = {}
+        self._buffers = {}
+        self._rows = 0
+
+    def add(self, frame, keys):
+        """按keys（与frame等长的分区键）把frame的行加入各分区的缓冲"""
+        for key, part in frame.groupby(keys, sort=False, observed=True):
+            self._buffers.setdefault(key, []).append(part)
+            self._rows += len(part)
+        while self._rows > self.max_rows:
+            self._flush(max(self._buffers, key=lambda k: sum(len(part) for part in self._buffers[k])))
+
+    def _flush(self, key):
+        parts = self._buffers.pop(key)
+        self._rows -= sum(len(part) for part in parts)
+        files = self.files.setdefault(key, [])
+        os.makedirs(os.path.join(self.directory, str(key)), exist_ok=True)
+        name = os.path.join(str(key), f'part-{len(files):05d}{frame_suffix(self.fmt)}')
+        write_frame(pd.concat(parts, ignore_index=True), os.path.join(self.directory, name), self.fmt)
+        files.append(name)
+
+    def close(self):
+        """写出全部缓冲，返回{分区键: 文件列表}（按分区键排序）"""
+        for key in list(self._buffers):
+            self._flush(key)
+        return {key: self.files[key] for key in sorted(self.files)}
+
+
+def read_meta(directory, name='meta.json'):
+    """读取目录中的JSON元数据，不存在或损坏时返回None"""
+    try:
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_meta(directory, meta, name='meta.json'):
+    """先写临时文件再替换，写出目录中的JSON元数据"""
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def fresh_directory(directory):
+    """创建空的临时目录directory.tmp并返回其路径，写完后用replace_directory()替换正式目录"""
+    tmp_dir = directory + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def replace_directory(tmp_dir, directory):
+    """用写完的临时目录替换正式目录，中途失败不会留下不完整的内容"""
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.replace(tmp_dir, directory)
+
+
+def same_sources(known, sources):
+    """比较记录的源文件指纹与当前文件，返回(是否一致, 更新了修改时间的指纹)
+
+    大小或内容变化都算不一致；文件只是被touch过（内容未变）时仍一致，
+    返回的指纹带有新的修改时间，调用方保存后下次无需重新计算哈希。
+    源文件已不存在时沿用记录的指纹，只剩缓存时仍可使用。
+    """
+    if set(known) != set(sources):
+        return False, known
+    current = {}
+    for name, path in sources.items():
+        if not os.path.exists(path):
+            current[name] = known[name]
+            continue
+        current[name] = file_fingerprint(path, known[name])
+        if current[name]['size'] != known[name]['size'] or current[name]['sha256'] != known[name]['sha256']:
+            return False, known
+    return True, current
+
+
+def load_cache(sources, params, cache_dir=SALES_CACHE_DIR):
+    """返回有效缓存的manifest，缓存不存在或已失效时返回None
+
+    sources为{名称: 文件路径}，params为影响缓存内容的参数（如附加的店铺属性）。
+    缓存只随源文件内容和params失效，与分析窗口无关。
+    """
+    manifest = read_meta(cache_dir, 'manifest.json')
+    if manifest is None or manifest.get('version') != CACHE_VERSION or manifest.get('params') != params:
+        return None
+    if manifest.get('paths') != sources:
+        return None
+    fresh, fingerprints = same_sources(manifest.get('sources', {}), sources)
+    if not fresh:
+        return None
+    if fingerprints != manifest['sources']:
+        manifest['sources'] = fingerprints
+        write_meta(cache_dir, manifest, 'manifest.json')
+    return manifest
+
+
+def read_cache(manifest, partitions, cache_dir=SALES_CACHE_DIR):
+    """读取manifest中指定分区的全部文件并合并，分区文件缺失或损坏时返回None"""
+    parts = []
+    for partition in partitions:
+        for name in manifest['partitions'][partition]:
+            try:
+                parts.append(read_frame(os.path.join(cache_dir, name), manifest['format']))
+            except (OSError, ImportError, ValueError, EOFError, pickle.UnpicklingError):
+                return None
+    return pd.concat(parts, ignore_index=True) if parts else None
+
+
+def save_cache(chunks, sources, params, partition_col, info=None, cache_dir=SALES_CACHE_DIR):
+    """将逐块产生的预处理数据按partition_col分区写入列式缓存，返回manifest
+
+    info为写入manifest的附加信息（如数据的日期范围），在全部块写完后读取。
+    先写到临时目录，manifest最后写入再替换正式目录，中途失败时不会读到不完整的缓存。
+    """
+    tmp_dir = fresh_directory(cache_dir)
+    writer = PartitionWriter(tmp_dir)
+    for chunk in chunks:
+        writer.add(chunk, chunk[partition_col])
+    partitions = writer.close()
+
+    manifest = {
+        'version': CACHE_VERSION,
+        'format': CACHE_FORMAT,
+        'params': params,
+        'paths': dict(sources),
+        'sources': {name: file_fingerprint(path) for name, path in sources.items()},
+        'partitions': {str(partition): files for partition, files in partitions.items()},
+        'info': dict(info or {}),
+    }
+    write_meta(tmp_dir, manifest, 'manifest.json')
+    replace_directory(tmp_dir, cache_dir)
+    return manifest
+
+
+def _source_name(manifest, path):
+    for name, source in manifest.get('paths', {}).items():
+        if os.path.abspath(source) == os.path.abspath(path):
+            return name
+    return None
+
+
+def recorded_fingerprint(path, cache_dir=SALES_CACHE_DIR):
+    """预处理缓存manifest中记录的源文件指纹（大小、修改时间及对应的内容哈希），没有记录时返回None"""
+    manifest = read_meta(cache_dir, 'manifest.json')
+    name = None if manifest is None else _source_name(manifest, path)
+    return None if name is None else manifest['sources'][name]
+
+
+def update_recorded_fingerprint(path, fingerprint, cache_dir=SALES_CACHE_DIR):
+    """文件只是被touch过（内容哈希未变）时，把新的修改时间写回manifest，之后的进程不必重新计算哈希"""
+    manifest = read_meta(cache_dir, 'manifest.json')
+    name = None if manifest is None else _source_name(manifest, path)
+    if name is None:
+        return
+    known = manifest['sources'][name]
+    if known['sha256'] == fingerprint['sha256'] and known != fingerprint:
+        manifest['sources'][name] = fingerprint
+        write_meta(cache_dir, manifest, 'manifest.json')
+
+
+def save_state(cube, meta, state_dir=os.path.join(CACHE_DIR, 'state')):
+    """保存增量更新所需的聚合状态（聚合立方体及其元数据，如周期粒度和已处理的最大日期）"""
+    os.makedirs(state_dir, exist_ok=True)
+    cube.to_pickle(os.path.join(state_dir, 'cube.pkl'))
+    meta = dict(meta, version=CACHE_VERSION)
+    tmp_path = os.path.join(state_dir, 'state.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(state_dir, 'state.json'))
+
+
+def load_state(state_dir=os.path.join(CACHE_DIR, 'state')):
+    """读取增量聚合状态，返回(立方体, 元数据)，不存在或版本不符时返回(None, None)"""
+    try:
+        with open(os.path.join(state_dir, 'state.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != CACHE_VERSION:
+            return None, None
+        return pd.read_pickle(os.path.join(state_dir, 'cube.pkl')), meta
+    except (OSError, ValueError):
+        return None, None
+
+
+class LRUCache:
+    """内存中按最近使用淘汰的字典，超过maxsize时丢弃最久未使用的条目，可在多个线程间共享"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回key对应的值并标记为最近使用，不存在时返回None"""
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        """写入key并标记为最近使用"""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ResultCache:
+    """归因查询结果缓存：内存中按LRU淘汰，同时持久化到cache_dir，进程重启后仍可命中
+
+    键由查询参数（窗口、维度、筛选条件等）和数据版本（源文件内容哈希及缓存格式版本）共同决定，
+    源文件变化后旧结果自然不再命中。可在多个线程间共享。
+    源文件指纹沿用sources_dir（预处理缓存）的manifest中持久化的记录，大小和修改时间未变时不重新哈希。
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, cache_dir=os.path.join(CACHE_DIR, 'results'),
+                 sources_dir=SALES_CACHE_DIR):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.sources_dir = sources_dir
+        self.hits = 0
+        self.misses = 0
+        self._memory = LRUCache(maxsize)
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def data_version(self, sources):
+        """源文件的数据版本；文件大小和修改时间未变时沿用上次的哈希，不重读文件
+
+        本进程还没有记录时，沿用预处理缓存manifest中持久化的指纹，新进程的首次查询也不必哈希整个文件。
+        """
+        digest = hashlib.sha256(str(CACHE_VERSION).encode())
+        for name in sorted(sources):
+            path = sources[name]
+            known = self._fingerprints.get(path)
+            if known is None:
+                known = recorded_fingerprint(path, self.sources_dir)
+                fingerprint = file_fingerprint(path, known)
+                if known is not None:
+                    update_recorded_fingerprint(path, fingerprint, self.sources_dir)
+            else:
+                fingerprint = file_fingerprint(path, known)
+            self._fingerprints[path] = fingerprint
+            digest.update(f'{name}:{fingerprint["sha256"]}'.encode())
+        return digest.hexdigest()
+
+    def key(self, query, sources):
+        """由查询参数（可JSON序列化的dict）和数据版本生成缓存键"""
+        payload = json.dumps({'query': query, 'version': self.data_version(sources)},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def get(self, key):
+        """返回缓存的结果，未命中时返回None"""
+        value = self._memory.get(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        self._memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """写入内存和磁盘"""
+        self._memory.put(key, value)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._path(key) + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        """清空内存和磁盘上的全部结果"""
+        self._memory.clear()
+        with self._lock:
+            if os.path.exists(self.cache_dir):
+                shutil.rmtree(self.cache_dir)
@@ -0,0 +1,241 @@
+"""切片扫描：在多个维度的全部取值组合中找出最能解释销售额变化的切片
+
+切片是若干维度取值的组合（如 StoreType=a & Promo=有促销 & CompetitionDistance=0~710），
+按切片的销售额变化（绝对值）排名。先把窗口数据汇总为 店铺 × 行级维度 × 周期 的单元格，
+店铺属性按Store附加到单元格上，之后每个切片的变化都只是单元格变化的求和。
+
+搜索按上界优先展开：切片任何细分的变化绝对值都不超过 max(切片内正变化之和, 负变化之和的绝对值)，
+上界不超过当前第top名的切片直接剪枝，因此只需评估全部组合中很小的一部分。
+每个切片的所有下一层细分用一次bincount同时算出。
+去掉某个条件后变化不为0的单元格不变的切片（如学校假期都不是法定假日时的
+"StateHoliday=非法定假日 & SchoolHoliday=学校假期"）只是更短切片的重复，不参与排名也不再细分。
+
+用法（在项目目录下运行）：
+    python slice_scan.py
+    python slice_scan.py --dims StoreType,Assortment,Promo,StateHoliday,CompetitionDistance --top 30 --max-depth 4
+"""
+import heapq
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from sales_analysis import (COMPARE_LABELS, DIMENSION_ANALYSES, FREQ_CHOICES, N_PERIODS, attach_store_attributes,
+                            comparison_lag, load_data, period_matrix, read_store_data, window_periods,
+                            with_period_labels)
+
+# 默认扫描的维度
+SCAN_DIMS = ['StoreType', 'Assortment', 'Promo', 'StateHoliday', 'SchoolHoliday', 'CompetitionDistance']
+
+# 行级维度（来自train.csv），其余维度从store.csv按店铺附加
+ROW_DIMS = ['Promo', 'SchoolHoliday', 'StateHoliday', 'DayOfWeek']
+
+# 每个周期对输出的切片数及切片最多包含的维度数
+TOP_SLICES = 20
+MAX_DEPTH = 3
+
+# 取值多于该数目的数值型店铺属性按分位数分桶
+MAX_DISTINCT_VALUES = 10
+N_BUCKETS = 4
+
+# 维度取值的中文标签
+SLICE_LABELS = {
+    **{dims[-1]: labels[1] for dims, _, _, labels in DIMENSION_ANALYSES if labels is not None},
+    'StateHoliday': {'0': '非法定假日', 'a': '公共假日', 'b': '复活节', 'c': '圣诞节'},
+}
+
+
+def bucket_store_attributes(store_data, columns, n_buckets=N_BUCKETS):
+    """把取值较多的数值型店铺属性按分位数分桶为区间标签，缺失值记为"缺失" """
+    store_data = store_data.copy()
+    for col in columns:
+        values = store_data[col]
+        if not pd.api.types.is_numeric_dtype(values) or values.nunique() <= MAX_DISTINCT_VALUES:
+            continue
+        edges = np.unique(np.nanquantile(values, np.linspace(0, 1, n_buckets + 1)))
+        labels = [f'{lo:g}~{hi:g}' for lo, hi in zip(edges[:-1], edges[1:])]
+        buckets = pd.cut(values, edges, labels=labels, include_lowest=True)
+        store_data[col] = buckets.cat.add_categories('缺失').fillna('缺失')
+    return store_data
+
+
+def slice_cells(data, dims, store_path='store.csv'):
+    """把窗口数据汇总为（单元格 × 周期）的销售额矩阵，返回(单元格属性表, 周期键, 销售额矩阵)
+
+    单元格为 店铺 × dims中的行级维度，dims中的店铺属性按Store附加到单元格上。
+    """
+    row_dims = [dim for dim in dims if dim in ROW_DIMS]
+    store_dims = [dim for dim in dims if dim not in ROW_DIMS]
+    pivot = period_matrix(data, ['Store'] + row_dims, 'Sales')
+    cells = pivot.index.to_frame(index=False)
+    if store_dims:
+        store_data = bucket_store_attributes(read_store_data(store_path, store_dims), store_dims)
+        cells = attach_store_attributes(cells, store_data, store_dims)
+    return cells, pivot.columns.to_numpy(), pivot.to_numpy(dtype=float)
+
+
+def encode_dims(cells, dims):
+    """把各维度编码为从0开始的整数，返回(编码矩阵(维度 × 单元格), 各维度的取值标签)"""
+    codes, labels = [], []
+    for dim in dims:
+        code, values = pd.factorize(cells[dim].astype(object), use_na_sentinel=False)
+        mapping = SLICE_LABELS.get(dim, {})
+        codes.append(code)
+        labels.append(['缺失' if pd.isna(v) else str(mapping.get(v, v)) for v in values])
+    return np.array(codes), labels
+
+
+def scan_slices(codes, delta, top=TOP_SLICES, max_depth=MAX_DEPTH):
+    """在维度取值组合中找出变化绝对值最大的top个切片
+
+    codes为(维度 × 单元格)的取值编码，delta为各单元格的变化。
+    切片按维度顺序只向后细分，每个组合只生成一次；按上界从大到小展开，
+    上界不超过当前第top名时停止。某个条件不减少变化不为0的单元格时，切片与去掉该条件的切片等价，
+    被跳过（它的细分也都等价于更短切片的细分）。
+    返回([(变化, 条件)]按变化绝对值降序, 评估的切片数)，条件为((维度序号, 取值编码), ...)。
+    """
+    n_dims = len(codes)
+    positive, negative = np.clip(delta, 0, None), np.clip(delta, None, 0)
+    nonzero = delta != 0
+    counts = {(): int(nonzero.sum())}   # 条件 -> 切片内变化不为0的单元格数
+    best = []       # 小顶堆：(变化绝对值, 序号, 变化, 条件)
+    frontier = [(-max(positive.sum(), -negative.sum()), 0, np.arange(len(delta)), (), -1)]
+    counter = itertools.count(1)
+    evaluated = 0
+
+    def threshold():
+        return best[0][0] if len(best) >= top else 0.0
+
+    def nonzero_count(conditions):
+        count = counts.get(conditions)
+        if count is None:
+            mask = nonzero.copy()
+            for d, value in conditions:
+                mask &= codes[d] == value
+            count = counts[conditions] = int(mask.sum())
+        return count
+
+    def redundant(conditions):
+        count = counts[conditions]
+        return any(nonzero_count(conditions[:i] + conditions[i + 1:]) == count for i in range(len(conditions)))
+
+    while frontier:
+        neg_bound, _, rows, conditions, last = heapq.heappop(frontier)
+        if -neg_bound <= threshold():
+            break
+        for d in range(last + 1, n_dims):
+            sub_codes = codes[d, rows]
+            n_values = sub_codes.max() + 1
+            sums = np.bincount(sub_codes, weights=delta[rows], minlength=n_values)
+            bounds = np.maximum(np.bincount(sub_codes, weights=positive[rows], minlength=n_values),
+                                -np.bincount(sub_codes, weights=negative[rows], minlength=n_values))
+            nonzero_counts = np.bincount(sub_codes, weights=nonzero[rows], minlength=n_values)
+            order = np.argsort(sub_codes, kind='stable')
+            splits = np.searchsorted(sub_codes[order], np.arange(n_values + 1))
+            for value in range(n_values):
+                if splits[value] == splits[value + 1]:
+                    continue
+                evaluated += 1
+                child = conditions + ((d, value),)
+                score = abs(sums[value])
+                if score <= threshold() and (len(child) >= max_depth or bounds[value] <= threshold()):
+                    continue
+                counts[child] = int(nonzero_counts[value])
+                if redundant(child):
+                    continue
+                if score > threshold():
+                    heapq.heappush(best, (score, next(counter), sums[value], child))
+                    if len(best) > top:
+                        heapq.heappop(best)
+                if len(child) < max_depth and bounds[value] > threshold():
+                    child_rows = rows[order[splits[value]:splits[value + 1]]]
+                    heapq.heappush(frontier, (-bounds[value], next(counter), child_rows, child, d))
+
+    ranked = sorted(best, key=lambda item: (-item[0], item[1]))
+    return [(change, conditions) for _, _, change, conditions in ranked], evaluated
+
+
+def count_slices(labels, max_depth=MAX_DEPTH):
+    """不剪枝时最多包含max_depth个维度的切片总数"""
+    sizes = [len(values) for values in labels]
+    return sum(int(np.prod(combo)) for depth in range(1, max_depth + 1)
+               for combo in itertools.combinations(sizes, depth))
+
+
+def slice_attribution(data, dims=SCAN_DIMS, lag=1, top=TOP_SLICES, max_depth=MAX_DEPTH, store_path='store.csv'):
+    """对窗口内每个(本期, 对比期)对做切片扫描，返回(结果表, 评估的切片数, 全部切片数)，周期列为整数键"""
+    cells, periods, sales = slice_cells(data, dims, store_path)
+    codes, labels = encode_dims(cells, dims)
+
+    rows, evaluated = [], 0
+    for i in range(lag, len(periods)):
+        prev, cur = sales[:, i - lag], sales[:, i]
+        total_change = cur.sum() - prev.sum()
+        found, n = scan_slices(codes, cur - prev, top, max_depth)
+        evaluated += n
+        for rank, (change, conditions) in enumerate(found, start=1):
+            mask = np.ones(len(cells), dtype=bool)
+            for d, value in conditions:
+                mask &= codes[d] == value
+            prev_sales, cur_sales = prev[mask].sum(), cur[mask].sum()
+            row = {
+                'Current_Month': periods[i],
+                'Prev_Month': periods[i - lag],
+                'Rank': rank,
+                'Slice': ' & '.join(f'{dims[d]}={labels[d][value]}' for d, value in conditions),
+                'Depth': len(conditions),
+                'Prev_Sales': prev_sales,
+                'Sales': cur_sales,
+                'Sales_Change': change,
+                'Change_Pct': (cur_sales / prev_sales - 1) * 100 if prev_sales else np.nan,
+                'Contribution_Pct': change / total_change * 100 if total_change else 0.0,
+            }
+            row.update({dim: None for dim in dims})
+            row.update({dims[d]: labels[d][value] for d, value in conditions})
+            rows.append(row)
+    return pd.DataFrame(rows), evaluated, count_slices(labels, max_depth) * (len(periods) - lag)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='切片扫描：找出最能解释销售额变化的维度取值组合')
+    parser.add_argument('--dims', default=','.join(SCAN_DIMS),
+                        help=f'扫描的维度（逗号分隔），行级维度{"/".join(ROW_DIMS)}或store.csv中的店铺属性，'
+                             f'默认{",".join(SCAN_DIMS)}')
+    parser.add_argument('--top', type=int, default=TOP_SLICES, help=f'每个周期对输出的切片数，默认{TOP_SLICES}')
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, help=f'切片最多包含的维度数，默认{MAX_DEPTH}')
+    parser.add_argument('--freq', choices=FREQ_CHOICES, default='M', help='周期粒度，默认M')
+    parser.add_argument('--compare', choices=list(COMPARE_LABELS), default='mom', help='对比方式，默认mom')
+    parser.add_argument('--periods', type=int, default=N_PERIODS, help=f'分析的周期数，默认{N_PERIODS}')
+    parser.add_argument('--start', help='窗口起始日期(YYYY-MM-DD)')
+    parser.add_argument('--end', help='窗口结束日期(YYYY-MM-DD)')
+    parser.add_argument('--output', default=os.path.join('output', 'slice_scan.csv'),
+                        help='结果文件，默认output/slice_scan.csv')
+    args = parser.parse_args()
+
+    dims = [dim for dim in args.dims.split(',') if dim]
+    try:
+        data = load_data(args.freq, window_periods(args.periods, args.freq, args.compare), args.start, args.end)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    start = time.time()
+    result, evaluated, total = slice_attribution(data, dims, comparison_lag(args.freq, args.compare),
+                                                 args.top, args.max_depth)
+    elapsed = time.time() - start
+    if result.empty:
+        raise SystemExit(f"窗口内的周期数不足以做{COMPARE_LABELS[args.compare]}对比，请扩大分析窗口")
+
+    result = with_period_labels(result, args.freq)
+    for (current_month, prev_month), part in result.groupby(['Current_Month', 'Prev_Month'], sort=False):
+        print(f"\n{current_month}相比{prev_month}, 最能解释销售额变化的切片:")
+        print(part[['Rank', 'Slice', 'Sales_Change', 'Change_Pct', 'Contribution_Pct']].to_string(index=False))
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    result.to_csv(args.output, index=False)
+    print(f"\n评估了 {evaluated} 个切片（不剪枝共 {total} 个），用时 {elapsed:.2f} 秒，结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
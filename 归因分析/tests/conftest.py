@@ -0,0 +1,29 @@
+"""测试共用的数据：在临时目录中生成两个月、三家店的小数据，其中店铺3不在store.csv中
+
+运行：在项目目录下 python -m pytest tests
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def train(tmp_path, monkeypatch):
+    """在临时目录中写出train.csv和store.csv并切换到该目录，返回train.csv的内容"""
+    rows = []
+    for store in [1, 2, 3]:
+        for i, date in enumerate(pd.date_range('2015-01-01', '2015-02-28')):
+            rows.append({'Store': store, 'DayOfWeek': date.dayofweek + 1, 'Date': date.strftime('%Y-%m-%d'),
+                         'Sales': 100 * store + i, 'Customers': 10 * store, 'Open': 1, 'Promo': i % 2,
+                         'StateHoliday': '0', 'SchoolHoliday': int(i % 7 == 0)})
+    train = pd.DataFrame(rows)
+    train.to_csv(tmp_path / 'train.csv', index=False)
+    # 店铺3不在store.csv中
+    pd.DataFrame({'Store': [1, 2], 'StoreType': ['a', 'b'], 'Assortment': ['a', 'c']}).to_csv(
+        tmp_path / 'store.csv', index=False)
+    monkeypatch.chdir(tmp_path)
+    return train
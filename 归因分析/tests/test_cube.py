@@ -0,0 +1,36 @@
+"""聚合立方体的回归测试：store.csv中没有的店铺也要计入各周期的总额
+
+数据见conftest.py中的train：两个月、三家店，其中店铺3不在store.csv中。
+"""
+import pandas as pd
+
+import daily_cube
+import out_of_core
+import sales_analysis as sa
+
+
+def _sorted(cube):
+    return cube.sort_values(['YearMonth'] + sa.CUBE_DIMS, ignore_index=True)
+
+
+def test_cube_keeps_store_missing_from_store_csv(train):
+    cube = sa.build_cube(sa.load_data('M', 2, use_cache=False))
+
+    missing = cube[cube['Store'] == 3]
+    assert len(missing) > 0
+    assert missing['StoreType'].isna().all()
+
+    expected = train.groupby(train['Date'].str[:7])['Sales'].sum().to_numpy()
+    monthly = sa.summarize_periods(cube)
+    assert monthly['Sales'].tolist() == expected.tolist()
+
+
+def test_cube_paths_keep_store_missing_from_store_csv(train):
+    expected = _sorted(sa.build_cube(sa.load_data('M', 2, use_cache=False)))
+
+    cubes = [daily_cube.load_period_cube('M', 2)[0],
+             out_of_core.load_period_cube('M', 2)[0],
+             out_of_core.load_period_cube('M', 2, workers=2)[0],
+             out_of_core.load_period_cube('M', 2, workers=2, partition_by='period')[0]]
+    for cube in cubes:
+        pd.testing.assert_frame_equal(_sorted(cube), expected, check_dtype=False)
@@ -0,0 +1,47 @@
+"""预处理缓存的测试：全部历史只预处理一次，不同窗口和粒度都从同一份缓存读取"""
+import os
+
+import pandas as pd
+import pytest
+
+import sales_analysis as sa
+import sales_cache
+
+MANIFEST = os.path.join('cache', 'sales', 'manifest.json')
+
+
+def _sorted(data):
+    return data.sort_values(['Date', 'Store'], ignore_index=True)
+
+
+@pytest.mark.parametrize('window', [('M', 2), ('M', 1), ('W', 3), ('Q', 1), ('M', 2, '2015-01-20', '2015-02-10')])
+def test_cache_matches_uncached_load(train, window):
+    pd.testing.assert_frame_equal(_sorted(sa.load_data(*window)), _sorted(sa.load_data(*window, use_cache=False)))
+
+
+def test_cache_is_not_rebuilt_for_another_window(train):
+    sa.load_data('M', 2)
+    built = os.stat(MANIFEST).st_mtime_ns
+    sa.load_data('W', 3)
+    sa.load_data('M', 1, end='2015-01-31')
+    assert os.stat(MANIFEST).st_mtime_ns == built
+
+
+def test_cache_is_rebuilt_when_store_csv_changes(train):
+    sa.load_data('M', 2)
+    pd.DataFrame({'Store': [1, 2, 3], 'StoreType': ['a', 'b', 'c']}).to_csv('store.csv', index=False)
+    data = sa.load_data('M', 2)
+    assert (data.loc[data['Store'] == 3, 'StoreType'] == 'c').all()
+
+
+def test_result_cache_reuses_recorded_fingerprints(train, monkeypatch):
+    sa.load_data('M', 2)
+    sources = {'train': 'train.csv', 'store': 'store.csv'}
+    expected = sales_cache.ResultCache().data_version(sources)
+
+    # 新进程中的结果缓存沿用manifest中记录的指纹，不再哈希源文件
+    def fail(path):
+        raise AssertionError(f"不应重新哈希 {path}")
+
+    monkeypatch.setattr(sales_cache, '_hash_file', fail)
+    assert sales_cache.ResultCache().data_version(sources) == expected
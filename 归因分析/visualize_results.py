@@ -0,0 +1,313 @@
+"""可视化图表：在当前进程内用Agg后端批量生成图表
+
+各图表的Figure对象在每个进程中只创建一次，之后清空重绘，不使用pyplot和seaborn，
+因此不需要图形界面，也不必为每张图重复初始化。每张图的输入数据计算一个哈希，
+与上次生成时相同且PNG仍在时直接跳过。
+
+多个窗口或分段的图表可以在一个批次中生成（render_batch），workers大于1时在进程池中并行，
+每个进程只初始化一次matplotlib。
+
+用法（在项目目录下运行）：
+    python visualize_results.py                             # 由output中的结果表生成output/figures
+    python visualize_results.py --by StoreType --workers 2  # 每种店铺类型一组图表
+"""
+import hashlib
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+from report_renderer import CONCLUSION_TABLES, contribution_factors, segment_tables
+
+# 图表输出目录
+FIGURE_DIR = os.path.join('output', 'figures')
+
+# 记录各图表输入数据哈希的文件（位于图表目录中）
+FIGURE_MANIFEST = '.figures.json'
+
+# 绘图样式版本，修改绘图代码后递增以重新生成全部图表
+FIGURE_VERSION = 1
+
+# 图表尺寸（英寸）和分辨率
+FIGURE_SIZE = (10, 6)
+FIGURE_DPI = 100
+
+# 中文字体候选（按顺序使用第一个可用的）
+CJK_FONTS = ['SimHei', 'Microsoft YaHei', 'PingFang SC', 'Noto Sans CJK SC', 'WenQuanYi Micro Hei',
+             'Arial Unicode MS', 'DejaVu Sans']
+
+# 本进程中各图表复用的Figure对象
+_figures = {}
+
+
+def _setup():
+    """初始化matplotlib（Agg后端、中文字体），每个进程只需一次"""
+    import matplotlib
+
+    matplotlib.use('Agg')
+    matplotlib.rcParams['font.sans-serif'] = CJK_FONTS
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    # 没有中文字体的环境中只是字形缺失，不影响图表生成
+    warnings.filterwarnings('ignore', message='Glyph .* missing')
+
+
+def _figure(name):
+    """取出（首次时创建）图表name的Figure对象并清空"""
+    figure = _figures.get(name)
+    if figure is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        _setup()
+        figure = Figure(figsize=FIGURE_SIZE, dpi=FIGURE_DPI)
+        FigureCanvasAgg(figure)
+        _figures[name] = figure
+    figure.clear()
+    return figure
+
+
+def _bar_labels(ax, bars, fmt):
+    for bar in bars:
+        height = bar.get_height()
+        ax.annotate(fmt.format(height), (bar.get_x() + bar.get_width() / 2, height),
+                    ha='center', va='bottom' if height >= 0 else 'top', fontsize=8)
+
+
+def draw_monthly_sales_trend(figure, tables):
+    """各周期销售额（柱）和客流量（线）"""
+    monthly_sales = tables['monthly_sales']
+    ax = figure.add_subplot()
+    periods = monthly_sales['YearMonth'].tolist()
+    bars = ax.bar(periods, monthly_sales['Sales'], color='#4C72B0', label='销售额')
+    _bar_labels(ax, bars, '{:,.0f}')
+    ax.set_ylabel('销售额')
+    customers = ax.twinx()
+    customers.plot(periods, monthly_sales['Customers'], color='#DD8452', marker='o', label='客流量')
+    customers.set_ylabel('客流量')
+    ax.set_title('各周期销售额与客流量趋势')
+    handles = ax.get_legend_handles_labels()[0] + customers.get_legend_handles_labels()[0]
+    ax.legend(handles=handles, loc='lower left')
+
+
+def draw_sales_change_waterfall(figure, tables):
+    """最近一个周期销售额变化的瀑布图：对比期销售额 → 客流量效应 → 客单价效应 → 本期销售额"""
+    latest = tables['contribution_analysis'].iloc[-1]
+    current = tables['monthly_sales'].set_index('YearMonth')['Sales'][latest['Current_Month']]
+    previous = current - latest['Sales_Change']
+    steps = [('客流量', latest['Customer_Contribution']), ('客单价', latest['AvgTicket_Contribution'])]
+
+    ax = figure.add_subplot()
+    labels = [latest['Prev_Month']] + [name for name, _ in steps] + [latest['Current_Month']]
+    bottoms, heights, colors = [0], [previous], ['#4C72B0']
+    level = previous
+    for _, change in steps:
+        bottoms.append(level if change >= 0 else level + change)
+        heights.append(abs(change))
+        colors.append('#55A868' if change >= 0 else '#C44E52')
+        level += change
+    bottoms.append(0)
+    heights.append(current)
+    colors.append('#4C72B0')
+    ax.bar(labels, heights, bottom=bottoms, color=colors)
+    for i, (name, change) in enumerate(steps, start=1):
+        ax.annotate(f'{change:+,.0f}', (i, bottoms[i] + heights[i]), ha='center', va='bottom', fontsize=9)
+    # 纵轴从对比期与本期中较小值的附近开始，突出变化部分
+    low = min(previous, current, *(bottom for bottom in bottoms[1:-1]))
+    high = max(previous, current, *(b + h for b, h in zip(bottoms[1:-1], heights[1:-1])))
+    margin = max((high - low) * 0.5, abs(high) * 0.001, 1)
+    ax.set_ylim(low - margin, high + margin)
+    ax.set_ylabel('销售额')
+    ax.set_title(f"{latest['Current_Month']}相比{latest['Prev_Month']}销售额变化分解")
+
+
+def _draw_dimension(figure, df, column, title):
+    """各周期按维度取值分组的贡献率柱状图"""
+    table = df.set_index(['Current_Month', column])['Contribution_Pct'].unstack(column)
+    ax = figure.add_subplot()
+    width = 0.8 / max(len(table.columns), 1)
+    positions = range(len(table.index))
+    for i, value in enumerate(table.columns):
+        ax.bar([p + (i - (len(table.columns) - 1) / 2) * width for p in positions], table[value].to_numpy(),
+               width=width, label=str(value))
+    ax.set_xticks(list(positions))
+    ax.set_xticklabels(table.index.tolist())
+    ax.axhline(0, color='grey', linewidth=0.8)
+    ax.set_ylabel('贡献率(%)')
+    ax.set_title(title)
+    ax.legend()
+
+
+def draw_store_type_contribution(figure, tables):
+    _draw_dimension(figure, tables['store_type_contribution'], 'StoreType', '各店铺类型对销售额变化的贡献率')
+
+
+def draw_promo_contribution(figure, tables):
+    _draw_dimension(figure, tables['promo_contribution'], 'Promo_Label', '促销对销售额变化的贡献率')
+
+
+def draw_holiday_contribution(figure, tables):
+    _draw_dimension(figure, tables['holiday_contribution'], 'Holiday_Label', '学校假期对销售额变化的贡献率')
+
+
+def draw_overall_contribution_comparison(figure, tables):
+    """最近一个周期各因素贡献率的横向比较（按绝对值排序）"""
+    factors = sorted(contribution_factors(tables), key=lambda x: abs(x[1]))
+    ax = figure.add_subplot()
+    ax.barh([name for name, _ in factors], [value for _, value in factors],
+            color=['#55A868' if value >= 0 else '#C44E52' for _, value in factors])
+    ax.axvline(0, color='grey', linewidth=0.8)
+    ax.set_xlabel('贡献率(%)')
+    ax.set_title(f"{tables['monthly_sales']['YearMonth'].iloc[-1]}各因素贡献率比较")
+    figure.tight_layout()
+
+
+# 图表名称 -> (绘图函数, 使用的结果表)
+FIGURE_RENDERERS = {
+    'monthly_sales_trend': (draw_monthly_sales_trend, ['monthly_sales']),
+    'sales_change_waterfall': (draw_sales_change_waterfall, ['monthly_sales', 'contribution_analysis']),
+    'store_type_contribution': (draw_store_type_contribution, ['store_type_contribution']),
+    'promo_contribution': (draw_promo_contribution, ['promo_contribution']),
+    'holiday_contribution': (draw_holiday_contribution, ['holiday_contribution']),
+    'overall_contribution_comparison': (draw_overall_contribution_comparison, CONCLUSION_TABLES),
+}
+
+# 可视化阶段输出的图表
+FIGURES = list(FIGURE_RENDERERS)
+
+
+def table_hashes(tables):
+    """各结果表内容的哈希
+
+    按排序后的CSV文本行计算，内存中的结果表与写出后再读回的同一张表（列类型、行序可能不同）哈希相同。
+    """
+    hashes = {}
+    for name, df in tables.items():
+        header, *lines = df.to_csv(index=False).splitlines()
+        hashes[name] = hashlib.sha256('\n'.join([header] + sorted(lines)).encode('utf-8')).hexdigest()
+    return hashes
+
+
+def _read_manifest(figure_dir):
+    try:
+        with open(os.path.join(figure_dir, FIGURE_MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_figures(tables=None, figure_dir=FIGURE_DIR, force=False, figures=FIGURES):
+    """生成一组图表，返回{图表名称: 状态}，状态为"完成"、"跳过"或失败原因
+
+    tables为结果表（已加上周期标签），未提供时从output目录读取CSV。
+    输入数据的哈希与上次生成时相同且PNG存在的图表被跳过（force为True时全部重新生成）。
+    """
+    if tables is None:
+        import pandas as pd
+        # round_trip：读回的浮点数与写出前完全相同，数据哈希才能与内存中的结果表一致
+        tables = {name: pd.read_csv(os.path.join('output', f'{name}.csv'), float_precision='round_trip')
+                  for name in CONCLUSION_TABLES}
+    os.makedirs(figure_dir, exist_ok=True)
+    hashes = table_hashes({name: tables[name] for name in CONCLUSION_TABLES})
+    manifest = _read_manifest(figure_dir)
+
+    status = {}
+    for name in figures:
+        draw, inputs = FIGURE_RENDERERS[name]
+        key = hashlib.sha256(json.dumps([FIGURE_VERSION] + [hashes[table] for table in inputs]).encode()).hexdigest()
+        path = os.path.join(figure_dir, f'{name}.png')
+        if not force and manifest.get(name) == key and os.path.exists(path):
+            status[name] = '跳过'
+            continue
+        figure = _figure(name)
+        try:
+            draw(figure, tables)
+            figure.savefig(path)
+        except (IndexError, KeyError, ValueError) as e:
+            manifest.pop(name, None)
+            status[name] = f"失败: {e}"
+            continue
+        manifest[name] = key
+        status[name] = '完成'
+
+    with open(os.path.join(figure_dir, FIGURE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return status
+
+
+def _render_job(job):
+    """进程池任务：job为(图表目录, 结果表或None, 聚合立方体或None, freq, compare, force)"""
+    figure_dir, tables, cube, freq, compare, force = job
+    if tables is None:
+        from report_renderer import conclusion_tables
+        try:
+            tables = conclusion_tables(cube, freq, compare)
+        except (IndexError, KeyError, ValueError) as e:
+            return figure_dir, {name: f"失败: {e}" for name in FIGURES}
+    return figure_dir, render_figures(tables, figure_dir, force)
+
+
+def render_batch(jobs, workers=1, force=False):
+    """批量生成多组图表（多个窗口或分段），返回{图表目录: {图表名称: 状态}}
+
+    jobs中每项为(图表目录, 结果表)或(图表目录, 聚合立方体, freq, compare)，后者在工作进程中计算结果表。
+    workers大于1时在进程池中并行，每个进程复用自己的Figure对象。
+    """
+    tasks = []
+    for job in jobs:
+        if len(job) == 2:
+            tasks.append((job[0], job[1], None, None, None, force))
+        else:
+            tasks.append((job[0], None) + tuple(job[1:]) + (force,))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_setup) as pool:
+            return dict(pool.map(_render_job, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    return dict(map(_render_job, tasks))
+
+
+def segment_jobs(cube, by, freq='M', compare='mom', figure_dir=FIGURE_DIR):
+    """按by列分段（各分段的结果表由segment_tables()一次算出），每个分段的图表写入figure_dir/<by>_<取值>/"""
+    return [(os.path.join(figure_dir, f'{by}_{value}'), tables)
+            for value, tables in segment_tables(cube, by, freq, compare).items()]
+
+
+def main():
+    import argparse
+    import time
+
+    import sales_analysis as sa
+
+    parser = argparse.ArgumentParser(description='生成可视化图表')
+    parser.add_argument('--by', help='按该列分段，每个分段生成一组图表（立方体中的列或store.csv中的店铺属性）；'
+                                     '不指定时由output中的结果表生成')
+    parser.add_argument('--freq', choices=sa.FREQ_CHOICES, default='M', help='分段时的周期粒度，默认M')
+    parser.add_argument('--compare', choices=list(sa.COMPARE_LABELS), default='mom', help='分段时的对比方式，默认mom')
+    parser.add_argument('--periods', type=int, default=sa.N_PERIODS, help=f'分段时分析的周期数，默认{sa.N_PERIODS}')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数，默认1')
+    parser.add_argument('--force', action='store_true', help='忽略数据哈希，重新生成全部图表')
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.by is None:
+        status = {FIGURE_DIR: render_figures(force=args.force)}
+    else:
+        cube = sa.build_cube(sa.load_data(args.freq, sa.window_periods(args.periods, args.freq, args.compare)))
+        try:
+            sa.check_comparable(cube, args.freq, args.compare)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        if args.by not in cube.columns:
+            cube = sa.attach_store_attributes(cube, sa.read_store_data('store.csv', [args.by]), [args.by])
+        status = render_batch(segment_jobs(cube, args.by, args.freq, args.compare), args.workers, args.force)
+
+    counts = {}
+    for figure_dir, figures in status.items():
+        for name, state in figures.items():
+            counts[state[:2]] = counts.get(state[:2], 0) + 1
+            if state.startswith('失败'):
+                print(f"{os.path.join(figure_dir, name)}: {state}")
+    print(f"图表已保存到 {FIGURE_DIR}：生成 {counts.get('完成', 0)} 张，未变化跳过 {counts.get('跳过', 0)} 张，"
+          f"失败 {counts.get('失败', 0)} 张，用时 {time.time() - start:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()